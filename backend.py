@@ -26,7 +26,8 @@
 # Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 ##################################################################################
 
-import logging, os, os.path, signal, sys
+import logging, os, os.path, signal, sys, time, threading, itertools
+import concurrent.futures
 
 from gi.repository import GObject
 import dbus
@@ -39,10 +40,29 @@ import subprocess
 import shutil
 from shlex import split
 
-from MythbuntuControlPanel.plugin import MCPPlugin
+from MythbuntuControlPanel.plugin import MCPPluginLoader
+from MythbuntuControlPanel.progress import CoalescedProgress
 
 DBUS_BUS_NAME = 'com.mythbuntu.ControlPanel'
 
+# seconds a PolicyKit authorization is reused for the same client
+AUTH_CACHE_TIMEOUT = 60
+# times CheckAuthorization is tried again after polkitd went away
+POLKIT_RETRIES = 2
+# scripted change units of a job that may run at the same time
+SCRIPTED_WORKERS = 4
+# seconds a backend call may take, starting a job may wait for the user
+# to authenticate
+CALL_TIMEOUT = 30
+AUTH_CALL_TIMEOUT = 600
+# seconds the backend stays up after its last registered client left
+CLIENT_GRACE = 5
+# seconds a registration keeps the backend up until the client passed a
+# PolicyKit check, as anyone may register
+UNAUTHORIZED_CLIENT_TIMEOUT = 1800
+# plugins preloaded in the background once the backend is on the bus
+PRELOAD_PLUGIN_ROOT = '/usr/share/mythbuntu/plugins'
+
 #Translation Support
 from gettext import gettext as _
 
@@ -59,46 +79,167 @@ class BackendCrashError(SystemError):
 
 #--------------------------------------------------------------------#
 
-def dbus_sync_call_signal_wrapper(dbus_iface, fn, handler_map, *args, **kwargs):
-    '''Run a D-BUS method call while receiving signals.
+class BackendClient():
+    '''Asynchronous client of the backend for programs running a GLib
+    main loop.
 
-    This function is an Ugly Hack™, since a normal synchronous dbus_iface.fn()
-    call does not cause signals to be received until the method returns. Thus
-    it calls fn asynchronously and sets up a temporary main loop to receive
-    signals and call their handlers; these are assigned in handler_map (signal
-    name → signal handler).
+    Every call takes reply and error handlers and its own timeout and
+    returns right away, so any number of calls and jobs can be in flight.
+    The job signals are subscribed to once, when the client first connects,
+    and handed to the handlers of the job they belong to.  If the backend
+    goes away, the error handler of each unfinished job gets a
+    BackendCrashError.
     '''
-    if not hasattr(dbus_iface, 'connect_to_signal'):
-        # not a D-BUS object
-        return getattr(dbus_iface, fn)(*args, **kwargs)
-
-    def _h_reply(result=None):
-        global _h_reply_result
-        _h_reply_result = result
-        loop.quit()
-
-    def _h_error(exception=None):
-        global _h_exception_exc
-        _h_exception_exc = exception
-        loop.quit()
-
-    loop = GObject.MainLoop()
-    global _h_reply_result, _h_exception_exc
-    _h_reply_result = None
-    _h_exception_exc = None
-    kwargs['reply_handler'] = _h_reply
-    kwargs['error_handler'] = _h_error
-    kwargs['timeout'] = 86400
-    for signame, sighandler in list(handler_map.items()):
-        dbus_iface.connect_to_signal(signame, sighandler)
-    dbus_iface.get_dbus_method(fn)(*args, **kwargs)
-    loop.run()
-    if _h_exception_exc:
-        raise _h_exception_exc
-    return _h_reply_result
+
+    def __init__(self, bus=None):
+        self._bus = bus
+        self._iface = None
+        self._matches = []
+        self._owner_watch = None
+        # job id -> dictionary of handlers
+        self._jobs = {}
+        self._registered = False
+
+    def _interface(self):
+        '''Return the D-BUS interface, connecting on first use.'''
+        if self._iface is None:
+            if self._bus is None:
+                self._bus = dbus.SystemBus()
+            # calls go to whichever backend owns the name, so one that
+            # timed out is activated again instead of going stale
+            obj = self._bus.get_object(DBUS_BUS_NAME, '/ControlPanel',
+                                       introspect=False, follow_name_owner_changes=True)
+            self._iface = dbus.Interface(obj, DBUS_BUS_NAME)
+            self._matches = [
+                self._iface.connect_to_signal('job_progress', self._on_job_progress),
+                self._iface.connect_to_signal('job_result', self._on_job_result),
+                self._iface.connect_to_signal('job_finished', self._on_job_finished)]
+            self._owner_watch = self._bus.watch_name_owner(DBUS_BUS_NAME, self._on_owner_changed)
+        return self._iface
+
+    def reset(self):
+        '''Drop the connection, the next call connects again.'''
+        try:
+            for match in self._matches:
+                match.remove()
+            if self._owner_watch is not None:
+                self._owner_watch.cancel()
+        finally:
+            self._matches = []
+            self._owner_watch = None
+            self._iface = None
+
+    def call(self, method, *args, reply_handler=None, error_handler=None, timeout=CALL_TIMEOUT):
+        '''Call a backend method without waiting for it to return.'''
+        if reply_handler is None:
+            reply_handler = lambda *result: None
+        if error_handler is None:
+            error_handler = lambda e: logging.warning('backend call %s failed: %s' % (method, e))
+        try:
+            self._interface().get_dbus_method(method)(*args,
+                reply_handler=reply_handler, error_handler=error_handler, timeout=timeout)
+        except dbus.DBusException as e:
+            error_handler(e)
+
+    def register(self):
+        '''Tell the backend this client is around.
+
+        The backend stays up until the client leaves the bus, and is
+        registered with again if it has to be started over.
+        '''
+        self._registered = True
+        self.call('register_client',
+                  error_handler=lambda e: logging.debug('unable to register with the backend: %s' % e))
+
+    def start_job(self, plugin_dictionary, plugin_root_path, started=None, progress=None,
+                  result=None, finished=None, error=None):
+        '''Start processing root scripted changes as a backend job.
+
+        started is called with the job id once it runs, progress with
+        (progress, percent) and result with (plugin, item, success, message)
+        for each reconfigure item while it runs, and finished with the job id and its final status: 'done',
+        'cancelled' or 'failed'.  error is called with an exception instead of finished if
+        the job couldn't be started or the backend went away.
+        '''
+        handlers = {'progress': progress, 'result': result,
+                    'finished': finished, 'error': error}
+
+        def _started(job_id):
+            self._jobs[job_id] = handlers
+            if started is not None:
+                started(job_id)
+
+        # the PolicyKit check may wait for the user to authenticate
+        self.call('start_scriptedchanges', plugin_dictionary, plugin_root_path,
+                  reply_handler=_started, error_handler=error, timeout=AUTH_CALL_TIMEOUT)
+
+    def cancel(self, job_id):
+        '''Ask the backend to stop a job before its next scripted change.'''
+        self.call('cancel', job_id)
+
+    def _handler(self, job_id, name):
+        handlers = self._jobs.get(job_id)
+        if handlers is None:
+            return None
+        return handlers[name]
+
+    def _on_job_progress(self, job_id, progress, percent):
+        handler = self._handler(job_id, 'progress')
+        if handler is not None:
+            handler(progress, percent)
+
+    def _on_job_result(self, job_id, plugin, item, success, message):
+        handler = self._handler(job_id, 'result')
+        if handler is not None:
+            handler(plugin, item, success, message)
+
+    def _on_job_finished(self, job_id, status):
+        handlers = self._jobs.pop(job_id, None)
+        if handlers is not None and handlers['finished'] is not None:
+            handlers['finished'](job_id, status)
+
+    def _on_owner_changed(self, owner):
+        if owner:
+            # a new backend doesn't know about us yet
+            if self._registered:
+                self.register()
+            return
+        for job_id in list(self._jobs):
+            handlers = self._jobs.pop(job_id)
+            logging.warning('backend went away while running job %s' % job_id)
+            if handlers['error'] is not None:
+                handlers['error'](BackendCrashError())
 
 #--------------------------------------------------------------------#
 
+class Job():
+    '''A scriptedchanges request ran on a worker thread of the backend'''
+
+    def __init__(self, job_id, owner, plugin_dictionary, plugin_root_path):
+        self.job_id = job_id
+        # D-BUS name of the client that started the job
+        self.owner = owner
+        self.plugin_dictionary = plugin_dictionary
+        self.plugin_root_path = plugin_root_path
+        self.cancelled = threading.Event()
+
+class ScriptedUnit():
+    '''Reconfigure items of a plugin that are processed by a single
+    root_scripted_changes call, along with the resources they touch'''
+
+    def __init__(self, plugin, instance, reconfigure, resources):
+        self.plugin = plugin
+        self.instance = instance
+        self.reconfigure = reconfigure
+        # None if the plugin didn't say, which means it may touch anything
+        self.resources = None if resources is None else set(resources)
+
+    def conflicts(self, other):
+        '''Return whether this unit must not run alongside other.'''
+        if self.resources is None or other.resources is None:
+            return True
+        return len(self.resources & other.resources) > 0
+
 class Backend(dbus.service.Object):
     '''Backend manager.
 
@@ -117,37 +258,63 @@ class Backend(dbus.service.Object):
         self.dbus_info = None
         self.polkit = None
         self.enforce_polkit = True
+        # (sender, privilege) -> time the authorization expires
+        self._auth_cache = {}
+        # sender -> pid
+        self._sender_pids = {}
+        self._watching_senders = False
+        # plugin root path -> MCPPluginLoader kept for the backend's lifetime
+        self.loaders = {}
+        # plugin instances are shared, so only one request uses them at a time
+        self._plugins_lock = threading.Lock()
+        # job id -> Job that hasn't finished yet
+        self._jobs = {}
+        self._job_ids = itertools.count(1)
+        # D-BUS name of a registered client that is still on the bus -> time
+        # its registration expires, None once it passed a PolicyKit check
+        self._clients = {}
+        self._had_clients = False
+        self._last_activity = time.monotonic()
 
         #TODO:
         # debug support
 
-    def run_dbus_service(self, timeout=None, send_usr1=False):
+    def run_dbus_service(self, timeout=None, send_usr1=False, grace=CLIENT_GRACE):
         '''Run D-BUS server.
 
-        If no timeout is given, the server will run forever, otherwise it will
-        return after the specified number of seconds.
+        If no timeout is given, the server will run forever.  Otherwise it
+        returns once it was idle for timeout seconds with no clients
+        registered through register_client, or grace seconds after the last
+        registered client left the bus.  It never returns while a job is
+        running.
 
         If send_usr1 is True, this will send a SIGUSR1 to the parent process
         once the server is ready to take requests.
         '''
         dbus.service.Object.__init__(self, self.bus, '/ControlPanel')
         main_loop = GObject.MainLoop()
-        self._timeout = False
+        self._grace = grace
+        self._reset_timeout()
         if timeout:
             def _t():
-                main_loop.quit()
+                if self._idle_expired(timeout):
+                    main_loop.quit()
+                    return False
                 return True
-            GObject.timeout_add(timeout * 1000, _t)
+            GObject.timeout_add_seconds(1, _t)
+
+        # import the plugins before the first request asks for them
+        if os.path.isdir(PRELOAD_PLUGIN_ROOT):
+            thread = threading.Thread(target=self._preload_plugins, args=(PRELOAD_PLUGIN_ROOT,),
+                                      name='preload-plugins')
+            thread.daemon = True
+            thread.start()
 
         # send parent process a signal that we are ready now
         if send_usr1:
             os.kill(os.getppid(), signal.SIGUSR1)
 
-        # run until we time out
-        while not self._timeout:
-            if timeout:
-                self._timeout = True
-            main_loop.run()
+        main_loop.run()
 
     @classmethod
     def create_dbus_server(klass):
@@ -168,7 +335,49 @@ class Backend(dbus.service.Object):
     def _reset_timeout(self):
         '''Reset the D-BUS server timeout.'''
 
-        self._timeout = False
+        self._last_activity = time.monotonic()
+
+    def _idle_expired(self, timeout):
+        '''Return whether the server has nothing left to do.  Once clients
+        have registered, the server only waits the grace period after the
+        last of them left instead of the full timeout.'''
+        now = time.monotonic()
+        for (client, expires) in list(self._clients.items()):
+            if expires is not None and expires <= now:
+                logging.debug('registration of unauthorized client %s expired' % client)
+                del self._clients[client]
+        if len(self._jobs) > 0 or len(self._clients) > 0:
+            return False
+        if self._had_clients:
+            timeout = min(timeout, self._grace)
+        return now - self._last_activity >= timeout
+
+    def _preload_plugins(self, plugin_root_path):
+        '''Import and construct every plugin under plugin_root_path, so the
+        first job finds them loaded.  Plugins that fail to load are logged
+        and left for the job that asks for them to report.'''
+        with self._plugins_lock:
+            loader = self.loaders.get(plugin_root_path)
+            if loader is None:
+                loader = MCPPluginLoader(plugin_root_path, modules=[])
+                self.loaders[plugin_root_path] = loader
+            try:
+                modules = list(loader.plugin_manifest().values())
+                loaded = self._load_plugins(plugin_root_path, modules)
+            except Exception:
+                logging.exception('unable to preload plugins from %s' % plugin_root_path)
+                return
+        for module in modules:
+            if module not in loaded:
+                logging.warning('plugin %s failed to preload' % module)
+        logging.debug('preloaded plugins: %s' % ', '.join(sorted(loaded)))
+
+    def _watch_senders(self, conn):
+        '''Subscribe to clients leaving the bus, once.'''
+        if not self._watching_senders:
+            conn.add_signal_receiver(self._on_name_owner_changed, 'NameOwnerChanged',
+                'org.freedesktop.DBus', 'org.freedesktop.DBus', '/org/freedesktop/DBus')
+            self._watching_senders = True
 
     def _check_polkit_privilege(self, sender, conn, privilege):
         '''Verify that sender has a given PolicyKit privilege.
@@ -180,6 +389,10 @@ class Backend(dbus.service.Object):
 
         This method returns if the caller is privileged, and otherwise throws a
         PermissionDeniedByPolicy exception.
+
+        Granted authorizations are reused for AUTH_CACHE_TIMEOUT seconds, or
+        until the sender leaves the bus, so back to back calls from the same
+        client don't each ask PolicyKit again.
         '''
         if sender is None and conn is None:
             # called locally, not through D-BUS
@@ -188,35 +401,220 @@ class Backend(dbus.service.Object):
             #yeah, i guess that sounds sensible to do..
             return
 
+        key = (sender, privilege)
+        if self._auth_cache.get(key, 0) > time.monotonic():
+            logging.debug('_check_polkit_privilege: using cached authorization of %s for %s' %
+                    (sender, privilege))
+            self._trust_client(sender)
+            return
+        self._auth_cache.pop(key, None)
+
         # get peer PID
         if self.dbus_info is None:
             self.dbus_info = dbus.Interface(conn.get_object('org.freedesktop.DBus',
                 '/org/freedesktop/DBus/Bus', False), 'org.freedesktop.DBus')
-        pid = self.dbus_info.GetConnectionUnixProcessID(sender)
+        self._watch_senders(conn)
+        pid = self._sender_pids.get(sender)
+        if pid is None:
+            pid = self.dbus_info.GetConnectionUnixProcessID(sender)
+            self._sender_pids[sender] = pid
 
         # query PolicyKit
-        if self.polkit is None:
-            self.polkit = dbus.Interface(dbus.SystemBus().get_object(
-                'org.freedesktop.PolicyKit1',
-                '/org/freedesktop/PolicyKit1/Authority', False),
-                'org.freedesktop.PolicyKit1.Authority')
-        try:
-            # we don't need is_challenge return here, since we call with AllowUserInteraction
-            (is_auth, _, details) = self.polkit.CheckAuthorization(
-                    ('unix-process', {'pid': dbus.UInt32(pid, variant_level=1),
-                     'start-time': dbus.UInt64(0, variant_level=1)}), 
-                     privilege, {'': ''}, dbus.UInt32(1), '', timeout=600)
-        except dbus.DBusException as e:
-            if e._dbus_error_name == 'org.freedesktop.DBus.Error.ServiceUnknown':
-                # polkitd timed out, connect again
-                self.polkit = None
-                return self._check_polkit_privilege(sender, conn, privilege)
-            else:
-                raise
+        for attempt in range(POLKIT_RETRIES + 1):
+            if self.polkit is None:
+                self.polkit = dbus.Interface(dbus.SystemBus().get_object(
+                    'org.freedesktop.PolicyKit1',
+                    '/org/freedesktop/PolicyKit1/Authority', False),
+                    'org.freedesktop.PolicyKit1.Authority')
+            try:
+                # we don't need is_challenge return here, since we call with AllowUserInteraction
+                (is_auth, _, details) = self.polkit.CheckAuthorization(
+                        ('unix-process', {'pid': dbus.UInt32(pid, variant_level=1),
+                         'start-time': dbus.UInt64(0, variant_level=1)}), 
+                         privilege, {'': ''}, dbus.UInt32(1), '', timeout=600)
+                break
+            except dbus.DBusException as e:
+                if e._dbus_error_name == 'org.freedesktop.DBus.Error.ServiceUnknown' and \
+                   attempt < POLKIT_RETRIES:
+                    # polkitd timed out, connect again
+                    self.polkit = None
+                else:
+                    raise
         if not is_auth:
             logging.debug('_check_polkit_privilege: sender %s on connection %s pid %i is not authorized for %s: %s' %
                     (sender, conn, pid, privilege, str(details)))
             raise PermissionDeniedByPolicy(privilege)
+        self._auth_cache[key] = time.monotonic() + AUTH_CACHE_TIMEOUT
+        self._trust_client(sender)
+
+    def _trust_client(self, sender):
+        '''Let the registration of a client that passed a PolicyKit check
+        last until it leaves the bus.'''
+        if sender in self._clients:
+            self._clients[sender] = None
+
+    def _on_name_owner_changed(self, name, old_owner, new_owner):
+        '''Forget the PID, authorizations and registration of a client that
+        left the bus.'''
+        if new_owner or not name.startswith(':'):
+            return
+        self._sender_pids.pop(name, None)
+        for key in list(self._auth_cache):
+            if key[0] == name:
+                del self._auth_cache[key]
+        if name in self._clients:
+            del self._clients[name]
+            logging.debug('client %s left, %i remaining' % (name, len(self._clients)))
+            # the grace period starts now
+            self._reset_timeout()
+
+    def _load_plugins(self, plugin_root_path, modules):
+        '''Return a dictionary of module name -> plugin instance for the
+        plugin modules asked for.
+
+        Loaders are kept per plugin root path for the lifetime of the
+        backend, so a module is only imported and its plugin only
+        constructed again once its file changed on disk.  Modules that were
+        never asked for are never imported.
+        '''
+        loader = self.loaders.get(plugin_root_path)
+        if loader is None:
+            loader = MCPPluginLoader(plugin_root_path, modules=[])
+            self.loaders[plugin_root_path] = loader
+        for module in modules:
+            if module not in loader.modules:
+                loader.modules.append(module)
+        loader.reload_plugins()
+        plugin_instances = {}
+        for instance in loader.find_plugin_instances():
+            module = instance.getInformation("module")
+            if module in modules:
+                instance.emit_progress=self.report_progress
+                plugin_instances[module] = instance
+        return plugin_instances
+
+    def _emit_from_thread(self, signal, *args):
+        '''Emit a D-BUS signal from the main loop on behalf of a worker thread.'''
+        def _emit():
+            signal(*args)
+            return False
+        GObject.idle_add(_emit)
+
+    def _plan_units(self, plugin, instance, reconfigure):
+        '''Return the ScriptedUnits of a plugin's reconfigure items.  Items
+        the plugin left out of its units get a unit of their own that
+        conflicts with everything.'''
+        try:
+            declared = instance.getScriptedResources(reconfigure)
+        except Exception:
+            logging.exception("getScriptedResources of %s plugin failed" % plugin)
+            declared = [(list(reconfigure), None)]
+        units = []
+        seen = set()
+        for (items, resources) in declared:
+            items = [item for item in items if item in reconfigure and item not in seen]
+            if len(items) == 0:
+                continue
+            seen.update(items)
+            units.append(ScriptedUnit(plugin, instance,
+                                      dict((item, reconfigure[item]) for item in items), resources))
+        rest = [item for item in reconfigure if item not in seen]
+        if len(rest) > 0:
+            units.append(ScriptedUnit(plugin, instance,
+                                      dict((item, reconfigure[item]) for item in rest), None))
+        return units
+
+    def _report_items(self, job, plugin, items, success, message):
+        '''Send a job_result for each reconfigure item of a plugin.'''
+        for item in items:
+            self._emit_from_thread(self.job_result, job.job_id, plugin, str(item), success, message)
+
+    def _run_units(self, job, units, progress):
+        '''Run units on a thread pool.  A unit starts once it doesn't
+        conflict with any running unit or any unit before it that is still
+        waiting, so conflicting units keep their order.  The items of each
+        unit get a job_result once it is over.  Returns a tuple (failed,
+        skipped) of whether any unit failed and the units that never ran
+        because of a cancel.'''
+        failed = False
+        skipped = []
+        pending = list(units)
+        running = {}
+        done_count = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=SCRIPTED_WORKERS) as executor:
+            while len(pending) > 0 or len(running) > 0:
+                if job.cancelled.is_set():
+                    for unit in pending:
+                        logging.debug("job %s: cancelled before %s plugin" % (job.job_id, unit.plugin))
+                    skipped.extend(pending)
+                    pending = []
+                waiting = []
+                for unit in list(pending):
+                    if any(unit.conflicts(other) for other in list(running.values()) + waiting):
+                        waiting.append(unit)
+                        continue
+                    pending.remove(unit)
+                    progress("Processing %s" % unit.plugin, done_count/len(units))
+                    logging.debug("job %s: processing %s of %s plugin" %
+                                  (job.job_id, ', '.join(unit.reconfigure), unit.plugin))
+                    running[executor.submit(unit.instance.root_scripted_changes, unit.reconfigure)] = unit
+                if len(running) == 0:
+                    break
+                (finished, unfinished) = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    unit = running.pop(future)
+                    done_count += 1
+                    exception = future.exception()
+                    if exception is None:
+                        self._report_items(job, unit.plugin, unit.reconfigure, True, '')
+                        continue
+                    logging.error("job %s: error processing %s plugin" % (job.job_id, unit.plugin),
+                                  exc_info=(type(exception), exception, exception.__traceback__))
+                    self._report_items(job, unit.plugin, unit.reconfigure, False, str(exception))
+                    failed = True
+        return (failed, skipped)
+
+    def _run_job(self, job):
+        '''Worker thread side of start_scriptedchanges.'''
+        # plugins don't wait for their progress to be seen, it is sent at a
+        # bounded rate and the client keeps each message up long enough
+        _progress = CoalescedProgress(
+            lambda progress, percent: self.job_progress(job.job_id, str(progress), str(percent)))
+
+        status = 'done'
+        with self._plugins_lock:
+            try:
+                _progress(_('Importing necessary plugins'), '0.0')
+                plugin_instances = self._load_plugins(job.plugin_root_path,
+                                                      list(job.plugin_dictionary))
+                units = []
+                for plugin in job.plugin_dictionary:
+                    if plugin not in plugin_instances:
+                        logging.warning("job %s: plugin %s is not available" % (job.job_id, plugin))
+                        self._report_items(job, plugin, job.plugin_dictionary[plugin], False,
+                                           _('Plugin is not available'))
+                        status = 'failed'
+                        continue
+                    instance = plugin_instances[plugin]
+                    instance.emit_progress = _progress
+                    units.extend(self._plan_units(plugin, instance, job.plugin_dictionary[plugin]))
+                (failed, skipped) = self._run_units(job, units, _progress)
+                if failed:
+                    status = 'failed'
+                if len(skipped) > 0 and status == 'done':
+                    status = 'cancelled'
+            except Exception:
+                logging.exception("job %s: failed" % job.job_id)
+                status = 'failed'
+        _progress.flush()
+        self._emit_from_thread(self._finish_job, job, status)
+
+    def _finish_job(self, job, status):
+        '''Forget a job and tell its client how it ended.'''
+        self._jobs.pop(job.job_id, None)
+        self._reset_timeout()
+        self.job_finished(job.job_id, status)
 
     #
     # Internal API for calling from Handlers (not exported through D-BUS)
@@ -244,45 +642,101 @@ class Backend(dbus.service.Object):
         self._reset_timeout()
         self._check_polkit_privilege(sender, conn, 'com.mythbuntu.controlpanel.scriptedchanges')
 
-        plugin_path = plugin_root_path + '/python'
-        plugin_instances = {}
+        logging.debug("scriptedchanges: using plugin_root_path of: %s" % plugin_root_path)
+        with self._plugins_lock:
+            self.report_progress(_('Importing necessary plugins'),'0.0')
+            plugin_instances = self._load_plugins(plugin_root_path, list(plugin_dictionary))
+
+            self.report_progress(_('Processing plugins'),'0.0')
+            #process each plugin individually
+            count=float(0)
+            for plugin in plugin_dictionary:
+                if plugin not in plugin_instances:
+                    logging.warning("scriptedchanges: plugin %s is not available" % plugin)
+                    continue
+                self.report_progress("Processing %s" % plugin, count/len(plugin_dictionary))
+                logging.debug("scriptedchanges: processing %s plugin " % plugin)
+                plugin_instances[plugin].root_scripted_changes(plugin_dictionary[plugin])
+                count += 1
 
-        logging.debug("scriptedchanges: using plugin_path of: %s" % plugin_path)
-        if plugin_path not in sys.path:
-            sys.path.insert(0, plugin_path)
+    @dbus.service.method(DBUS_INTERFACE_NAME,
+        in_signature='a{sa{sv}}s', out_signature='s', sender_keyword='sender',
+        connection_keyword='conn')
+    def start_scriptedchanges(self, plugin_dictionary, plugin_root_path, sender=None, conn=None):
+        '''Starts processing the same changes as scriptedchanges on a worker
+           thread and returns a job id right away, so the backend keeps
+           answering calls while the changes run.
+
+           Changes of plugins that declared disjoint resources through
+           getScriptedResources run at the same time.  Progress is sent as
+           job_progress and the outcome of each reconfigure item as
+           job_result, items skipped by a cancel get none.  job_finished is
+           sent last with a status of 'done', 'cancelled' or 'failed'.
+        '''
+        self._reset_timeout()
+        self._check_polkit_privilege(sender, conn, 'com.mythbuntu.controlpanel.scriptedchanges')
 
-        self.report_progress(_('Importing necessary plugins'),'0.0')
-        for item in plugin_dictionary:
-            #load plugin
-            logging.debug("scriptedchanges: attempting to import plugin: %s" % item)
-            try:
-                __import__(item, None, None, [''])
-            except:
-                logging.warning("scriptedchanges: error importing plugin: %s " % item)
-                del plugin_dictionary[item]
-                continue
+        job = Job(str(next(self._job_ids)), sender, dict(plugin_dictionary), str(plugin_root_path))
+        self._jobs[job.job_id] = job
+        logging.debug("start_scriptedchanges: starting job %s for %s" % (job.job_id, sender))
+        thread = threading.Thread(target=self._run_job, args=(job,),
+                                  name='scriptedchanges-' + job.job_id)
+        thread.daemon = True
+        thread.start()
+        return job.job_id
 
-        self.report_progress(_('Instantiating necessary plugins'),'0.0')
-        for item in MCPPlugin.__subclasses__():
-            #instantiate
-            logging.debug("scriptedchanges: attempting to instantiate plugin: %s" % item)
-            try:
-                plugin_instances[item] = item()
-                plugin_instances[item].emit_progress=self.report_progress
-            except:
-                logging.warning("scriptedchanges: error instantiating plugin %s " % item)
-
-        self.report_progress(_('Processing plugins'),'0.0')
-        #process each plugin individually
-        count=float(0)
-        for plugin in plugin_dictionary:
-            for instance in plugin_instances:
-                if plugin_instances[instance].__class__.__module__ == plugin:
-                    self.report_progress("Processing %s" % plugin, count/len(plugin_dictionary))
-                    logging.debug("scriptedchanges: processing %s plugin " % plugin)
-                    plugin_instances[instance].root_scripted_changes(plugin_dictionary[plugin])
-                    count += 1
-                    break
+    @dbus.service.method(DBUS_INTERFACE_NAME,
+        in_signature='', out_signature='', sender_keyword='sender',
+        connection_keyword='conn')
+    def register_client(self, sender=None, conn=None):
+        '''Keeps the backend running until the calling client leaves the
+           bus.  Clients register when they start so the plugins are
+           already loaded by their first request.
+
+           No PolicyKit check is done here so starting a frontend doesn't
+           ask for a password.  Until the client passes one through another
+           call, its registration only lasts UNAUTHORIZED_CLIENT_TIMEOUT
+           seconds.
+        '''
+        self._reset_timeout()
+        if sender is None or conn is None:
+            return
+        self._watch_senders(conn)
+        if self._clients.get(sender, 0) is not None:
+            self._clients[sender] = time.monotonic() + UNAUTHORIZED_CLIENT_TIMEOUT
+        self._had_clients = True
+        logging.debug('register_client: %s, %i registered' % (sender, len(self._clients)))
+
+    @dbus.service.method(DBUS_INTERFACE_NAME,
+        in_signature='s', out_signature='b', sender_keyword='sender',
+        connection_keyword='conn')
+    def cancel(self, job_id, sender=None, conn=None):
+        '''Asks a job not to start any more of its scripted changes.
+           Changes that are already being processed are allowed to finish.  Returns False if
+           the job isn't running or was started by another client.
+        '''
+        self._reset_timeout()
+        job = self._jobs.get(job_id)
+        if job is None or (sender is not None and job.owner != sender):
+            return False
+        job.cancelled.set()
+        return True
+
+    @dbus.service.signal(DBUS_INTERFACE_NAME, signature='sss')
+    def job_progress(self, job_id, progress, percent):
+        '''Report script progress of a job'''
+        self._reset_timeout()
+        return True
+
+    @dbus.service.signal(DBUS_INTERFACE_NAME, signature='sssbs')
+    def job_result(self, job_id, plugin, item, success, message):
+        '''Report whether a reconfigure item of a plugin was applied'''
+        return True
+
+    @dbus.service.signal(DBUS_INTERFACE_NAME, signature='ss')
+    def job_finished(self, job_id, status):
+        '''Report that a job is over'''
+        return True
 
     @dbus.service.signal(DBUS_INTERFACE_NAME)
     def report_error(self, error_str, secondary=None):
@@ -0,0 +1,612 @@
+#!/usr/bin/python3
+## -*- coding: utf-8 -*-
+#
+# «mcp_benchmark» - Headless benchmarks for the MCP plugin state machine
+#
+# Copyright (C) 2020, Ted (MythTV forums member heyted)
+#
+# This is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 3 of the License, or at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this application; if not, write to the Free Software Foundation, Inc., 51
+# Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##################################################################################
+
+'''Headless benchmarks for MCP.
+
+Runs without a display, a system D-Bus or a real apt.  Gtk, apt_pkg, dbus
+and aptdaemon are replaced by small stand-ins before any MCP code is
+imported, plugin pages are built from their .ui files into fake widgets,
+and everything runs against synthetic plugins and a throwaway $HOME.
+
+Results are printed (or written with --output) as JSON so they can be
+compared across releases:
+
+ $ python3 benchmarks/mcp_benchmark.py --plugins 50 --output bench.json
+'''
+
+import sys, os, time, json, types, optparse, tempfile, shutil, statistics, platform
+import importlib.util, importlib.machinery, importlib.abc
+import xml.etree.ElementTree as et
+
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#Modules that must not be imported until they are used, see --import-budget
+DEFERRED_IMPORTS = ('apt_pkg', 'aptdaemon', 'aptdaemon.client', 'aptdaemon.gtk3widgets',
+                    'urllib3', 'urllib.request')
+
+#--------------------------------------------------------------------#
+# Stand-ins for the GUI, apt and D-Bus
+
+class _Stub(object):
+    '''Accepts any attribute access or call and does nothing'''
+    def __init__(self, *args, **kwargs):
+        pass
+    def __getattr__(self, name):
+        return _Stub()
+    def __call__(self, *args, **kwargs):
+        return _Stub()
+    def __bool__(self):
+        return False
+    def __iter__(self):
+        return iter(())
+
+class FakeModel(object):
+    '''Tree model of a combo box'''
+    def __init__(self):
+        self.items = []
+    def clear(self):
+        self.items = []
+    def __len__(self):
+        return len(self.items)
+    def __iter__(self):
+        return iter([item] for item in self.items)
+
+class FakeWidget(object):
+    '''Remembers the state a plugin sets and hands it back'''
+    def __init__(self, name=None, klass=None):
+        self._name = name
+        self.klass = klass
+        self.active = False
+        self.text = ''
+        self.sensitive = True
+        self.visible = True
+        self.model = FakeModel()
+        self.children = []
+        self.parent = None
+        self.handlers = {}
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+    def set_name(self, name):
+        self._name = name
+    def get_name(self):
+        return self._name
+    def connect(self, signal, handler, *args):
+        self.handlers.setdefault(signal, []).append(handler)
+        return len(self.handlers[signal])
+    def emit(self, signal):
+        for handler in self.handlers.get(signal, []):
+            handler(self)
+
+    def set_active(self, active):
+        changed = active != self.active
+        self.active = active
+        if changed:
+            self.emit('toggled')
+            self.emit('changed')
+    def get_active(self):
+        return self.active
+    def set_text(self, text):
+        self.text = text
+    def get_text(self):
+        return self.text
+    def get_model(self):
+        return self.model
+    def append_text(self, text):
+        self.model.items.append(text)
+    def get_active_text(self):
+        if type(self.active) is int and 0 <= self.active < len(self.model.items):
+            return self.model.items[self.active]
+        return None
+    def set_sensitive(self, sensitive):
+        self.sensitive = sensitive
+    def get_sensitive(self):
+        return self.sensitive
+    def show(self):
+        self.visible = True
+    def hide(self):
+        self.visible = False
+    def get_properties(self, *names):
+        return [getattr(self, name) for name in names]
+    def get_parent(self):
+        return self.parent
+
+    #containers and notebooks
+    def add(self, child):
+        self.children.append(child)
+    def remove(self, child):
+        self.children.remove(child)
+    def get_children(self):
+        return list(self.children)
+    def append_page(self, child, label=None):
+        self.children.append(child)
+        if isinstance(child, FakeWidget):
+            child.parent = self
+        return len(self.children) - 1
+    def insert_page(self, child, label, position):
+        self.children.insert(position, child)
+        if isinstance(child, FakeWidget):
+            child.parent = self
+        return position
+    def remove_page(self, position):
+        del self.children[position]
+    def page_num(self, child):
+        for index, page in enumerate(self.children):
+            if page is child:
+                return index
+        return -1
+
+class FakeRadio(FakeWidget):
+    pass
+
+class FakeCombo(FakeWidget):
+    pass
+
+#widget classes of the .ui files that need their own stand-in
+FAKE_CLASSES = {'GtkRadioButton': FakeRadio, 'GtkComboBox': FakeCombo,
+                'GtkComboBoxText': FakeCombo}
+
+class FakeBuilder(object):
+    '''Builds FakeWidgets for every object with an id in a .ui file'''
+    def __init__(self):
+        self.objects = {}
+    def add_from_file(self, ui_file):
+        for node in et.parse(ui_file).iter('object'):
+            if node.get('id'):
+                fake = FAKE_CLASSES.get(node.get('class'), FakeWidget)
+                self.objects[node.get('id')] = fake(node.get('id'), node.get('class'))
+    def get_objects(self):
+        return list(self.objects.values())
+    def get_object(self, name):
+        return self.objects.get(name)
+    def connect_signals(self, handler):
+        pass
+
+class FakeCache(object):
+    '''apt_pkg.Cache stand-in where nothing is installed'''
+    def __getitem__(self, package):
+        raise KeyError(package)
+    def __contains__(self, package):
+        return False
+
+class FakeDBusException(Exception):
+    _dbus_error_name = 'org.freedesktop.DBus.Error.Failed'
+    def get_dbus_name(self):
+        return self._dbus_error_name
+    def get_dbus_message(self):
+        return str(self)
+
+class FakeDBusObject(object):
+    def __init__(self, *args, **kwargs):
+        pass
+
+def _decorator(*args, **kwargs):
+    return lambda function: function
+
+#Stand-in modules by name.  They only show up in sys.modules once
+#something imports them, so deferred imports can be checked
+STUBS = {}
+
+class _StubFinder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    def find_spec(self, name, path, target=None):
+        if name in STUBS:
+            return importlib.util.spec_from_loader(name, self)
+        return None
+    def is_package(self, name):
+        return hasattr(STUBS[name], '__path__')
+    def create_module(self, spec):
+        return STUBS[spec.name]
+    def exec_module(self, module):
+        pass
+
+def _module(name, **attributes):
+    module = types.ModuleType(name)
+    for key, value in attributes.items():
+        setattr(module, key, value)
+    #parents of other stand-ins need to be packages
+    parent = name.rpartition('.')[0]
+    if parent:
+        STUBS[parent].__path__ = []
+    STUBS[name] = module
+    return module
+
+def install_stubs():
+    '''Replaces the GUI, apt and D-Bus modules before MCP imports them'''
+    Gtk = _Stub()
+    Gtk.Widget = FakeWidget
+    Gtk.Builder = FakeBuilder
+    Gtk.ToggleButton = Gtk.Entry = FakeWidget
+    Gtk.ComboBox = Gtk.ComboBoxText = FakeCombo
+    Gtk.RadioButton = FakeRadio
+    Gtk.Buildable = types.SimpleNamespace(get_name=lambda widget: widget.get_name())
+    Gtk.events_pending = lambda: False
+    GLib = _Stub()
+    GLib.idle_add = lambda function, *args: function(*args)
+    GLib.timeout_add = lambda interval, function, *args: 0
+    GLib.source_remove = lambda source: None
+    gi = _module('gi', require_version=lambda *args: None)
+    gi.repository = _module('gi.repository', Gtk=Gtk, Gdk=_Stub(), GLib=GLib,
+                            GObject=GLib, Gio=_Stub())
+
+    _module('apt_pkg', init=lambda: None, Cache=lambda *args: FakeCache())
+
+    dbus = _module('dbus', DBusException=FakeDBusException, SystemBus=_Stub,
+                   Interface=_Stub, UInt32=int, UInt64=int, String=str, Boolean=bool)
+    dbus.service = _module('dbus.service', Object=FakeDBusObject, BusName=_Stub,
+                           method=_decorator, signal=_decorator)
+    dbus.mainloop = _module('dbus.mainloop')
+    dbus.mainloop.glib = _module('dbus.mainloop.glib', DBusGMainLoop=lambda **kwargs: None,
+                                 threads_init=lambda: None)
+    dbus.exceptions = _module('dbus.exceptions', DBusException=FakeDBusException)
+
+    aptdaemon = _module('aptdaemon')
+    aptdaemon.client = _module('aptdaemon.client', AptClient=_Stub)
+    aptdaemon.enums = _module('aptdaemon.enums')
+    aptdaemon.gtk3widgets = _module('aptdaemon.gtk3widgets', AptErrorDialog=_Stub,
+                                    AptProgressDialog=_Stub)
+    sys.meta_path.insert(0, _StubFinder())
+
+def import_mcp():
+    '''Imports the source tree as the MythbuntuControlPanel package'''
+    spec = importlib.util.spec_from_file_location('MythbuntuControlPanel',
+                os.path.join(SOURCE_DIR, '__init__.py'),
+                submodule_search_locations=[SOURCE_DIR])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules['MythbuntuControlPanel'] = package
+    spec.loader.exec_module(package)
+
+def import_frontend():
+    '''Imports the mythbuntu-control-panel script as a module'''
+    loader = importlib.machinery.SourceFileLoader('mcp_frontend',
+                os.path.join(SOURCE_DIR, 'mythbuntu-control-panel'))
+    spec = importlib.util.spec_from_loader('mcp_frontend', loader)
+    frontend = importlib.util.module_from_spec(spec)
+    loader.exec_module(frontend)
+    return frontend
+
+#--------------------------------------------------------------------#
+# Synthetic inputs
+
+SYNTHETIC_PLUGIN = '''
+from MythbuntuControlPanel.plugin import MCPPlugin
+
+class SyntheticPlugin%(index)d(MCPPlugin):
+    """Synthetic plugin %(index)d"""
+
+    def __init__(self):
+        information = {}
+        information["name"] = "Synthetic %(index)d"
+        information["icon"] = "gtk-add"
+        information["ui"] = "tab_synthetic_%(index)d"
+        MCPPlugin.__init__(self,information)
+
+    def probeState(self):
+        self.state = {}
+        for number in range(%(widgets)d):
+            self.state[number] = self.snapshot.exists("%(home)s/synthetic_%(index)d_%%d" %% number)
+
+    def applyStateToGUI(self):
+        for number in range(%(widgets)d):
+            getattr(self, "check_%%d" %% number).set_active(self.state[number])
+
+    def compareState(self):
+        MCPPlugin.clearParentState(self)
+        for number in range(%(widgets)d):
+            if getattr(self, "check_%%d" %% number).get_active() != self.state[number]:
+                self._markInstall("synthetic-%(index)d-%%d" %% number)
+                self._markReconfigureRoot("item_%%d" %% number, True)
+
+    def root_scripted_changes(self,reconfigure):
+        for item in reconfigure:
+            self.emit_progress(item, 50)
+'''
+
+def synthetic_ui(index, widgets):
+    children = ''.join('<child><object class="GtkCheckButton" id="check_%d"/></child>' % number
+                       for number in range(widgets))
+    return ('<?xml version="1.0" encoding="UTF-8"?><interface>'
+            '<object class="GtkBox" id="tab_synthetic_%d">%s</object></interface>' % (index, children))
+
+def make_plugin_root(directory, plugins, widgets, home):
+    '''Creates a plugin root with synthetic plugins'''
+    os.makedirs(os.path.join(directory, 'python'))
+    os.makedirs(os.path.join(directory, 'ui'))
+    for index in range(plugins):
+        with open(os.path.join(directory, 'python', 'plg_synthetic_%d.py' % index), 'w') as source:
+            source.write(SYNTHETIC_PLUGIN % {'index': index, 'widgets': widgets, 'home': home})
+        with open(os.path.join(directory, 'ui', 'tab_synthetic_%d.ui' % index), 'w') as ui:
+            ui.write(synthetic_ui(index, widgets))
+    return directory
+
+def shipped_plugin_root(directory):
+    '''Creates a plugin root holding the plugins shipped with MCP'''
+    os.makedirs(os.path.join(directory, 'python'))
+    os.makedirs(os.path.join(directory, 'ui'))
+    for name in os.listdir(SOURCE_DIR):
+        if name.startswith('plg_') and name.endswith('.py'):
+            shutil.copy(os.path.join(SOURCE_DIR, name), os.path.join(directory, 'python'))
+        elif name.startswith('tab_') and name.endswith('.ui'):
+            shutil.copy(os.path.join(SOURCE_DIR, name), os.path.join(directory, 'ui'))
+    return directory
+
+def plugin_modules(plugin_root):
+    '''Returns the plugin modules of a plugin root, so loaders ignore
+    plugins of the other roots that are already imported'''
+    return [name[:-3] for name in os.listdir(os.path.join(plugin_root, 'python'))
+            if name.endswith('.py')]
+
+#Release the synthetic lsb-release and repos.db are written for
+CODENAME = 'focal'
+
+def make_home(home, repos, keymaps):
+    '''Fills a throwaway $HOME with a large repos.db, many keymaps and
+    an lsb-release for the Repositories plugin'''
+    os.makedirs(os.path.join(home, '.mythbuntu'))
+    with open(os.path.join(home, 'lsb-release'), 'w') as lsb:
+        lsb.write('DISTRIB_ID=Ubuntu\nDISTRIB_CODENAME=%s\n' % CODENAME)
+    with open(os.path.join(home, '.mythbuntu', 'repos.db'), 'w') as db:
+        db.write('MYTHTV_RELEASE\t32\nTRUNKPASS\tsecret\n')
+        for number in range(repos):
+            db.write('%s\t%d.%d\n' % (CODENAME, number // 10, number % 10))
+    for number in range(keymaps):
+        open(os.path.join(home, 'keymap_%d.toml' % number), 'w').close()
+
+def make_dpkg_status(path, packages):
+    with open(path, 'w') as status:
+        for number in range(packages):
+            status.write('Package: package-%d\nStatus: install ok installed\n'
+                         'Architecture: amd64\nVersion: 1.%d\n\n' % (number, number))
+
+#--------------------------------------------------------------------#
+# Harness
+
+def synthetic_snapshot():
+    '''A SystemSnapshot where every systemd unit is inactive, so probes
+    never run systemctl or reach the system bus'''
+    from MythbuntuControlPanel.snapshot import SystemSnapshot
+    snapshot = SystemSnapshot()
+    snapshot.unit_active = lambda unit: False
+    return snapshot
+
+def build_plugin(plugin, plugin_root):
+    '''Builds a plugin page into fake widgets without a notebook'''
+    plugin._set_root_path(plugin_root)
+    plugin._notebook = FakeWidget('tabs')
+    plugin.build_subpage()
+    return plugin
+
+def make_control_panel(frontend, plugin_root, home, parallel=False, cached_state=False):
+    '''Creates a ControlPanel the way __init__ does, minus Gtk.main'''
+    from MythbuntuControlPanel.plugin import MCPPluginLoader, ChangeSet
+    from MythbuntuControlPanel.packages import PackageCache, DpkgStatusIndex
+    from MythbuntuControlPanel.timing import PhaseTimer
+    from MythbuntuControlPanel.statecache import WidgetStateCache
+    from MythbuntuControlPanel.progress import ProgressDisplay
+    cp = frontend.ControlPanel.__new__(frontend.ControlPanel)
+    cp.timer = PhaseTimer(enabled=False)
+    cp.ac = None
+    cp.package_cache = PackageCache()
+    cp.package_stamps = {}
+    status = os.path.join(home, 'dpkg-status')
+    cp.dpkg_index = DpkgStatusIndex(status, os.path.join(home, '.mythbuntu', 'dpkg-status.json'))
+    cp.builder = FakeBuilder()
+    cp.builder.add_from_file(os.path.join(SOURCE_DIR, 'mythbuntu_control_panel.ui'))
+    for widget in cp.builder.get_objects():
+        setattr(cp, widget.get_name(), widget)
+    cp.plugin_root_path = plugin_root
+    cp.index = {}
+    cp.plugins = []
+    cp.lazy = False
+    cp.parallel = parallel
+    cp.executor = None
+    cp.pending_probes = set()
+    cp.watcher = None
+    cp.cached_state = cached_state
+    cp.state_cache = WidgetStateCache(os.path.join(home, '.mythbuntu', 'state.json'))
+    if cached_state:
+        cp.state_cache.load()
+    cp.loader = MCPPluginLoader(plugin_root, cp.timer, plugin_modules(plugin_root))
+    cp.changes = ChangeSet()
+    cp.progress = ProgressDisplay(cp._show_progress)
+    cp._client = None
+    cp.job_ids = set()
+    cp.pipeline = None
+    cp.applying = []
+    cp.packages_changed = False
+    cp.apt_transaction = None
+    return cp
+
+def wait_for_probes(cp):
+    while len(cp.pending_probes) > 0:
+        time.sleep(0.0005)
+
+def measure(name, function, iterations, setup=None):
+    '''Times function and returns a result record'''
+    samples = []
+    try:
+        for iteration in range(iterations):
+            if setup is not None:
+                setup()
+            begin = time.perf_counter()
+            function()
+            samples.append(time.perf_counter() - begin)
+    except Exception as e:
+        return {'name': name, 'error': '%s: %s' % (type(e).__name__, e)}
+    return {'name': name,
+            'iterations': len(samples),
+            'min_ms': min(samples) * 1000,
+            'mean_ms': statistics.mean(samples) * 1000,
+            'median_ms': statistics.median(samples) * 1000,
+            'max_ms': max(samples) * 1000}
+
+def touch_plugins(cp, widgets):
+    '''Flips one checkbox on every plugin, as a user would'''
+    def setup():
+        for plugin in cp.plugins:
+            widget = getattr(plugin, 'check_%d' % (widgets - 1))
+            widget.set_active(not widget.get_active())
+    return setup
+
+def run(options):
+    results = []
+    workdir = tempfile.mkdtemp(prefix='mcp-benchmark-')
+    try:
+        home = os.path.join(workdir, 'home')
+        make_home(home, options.repos, options.keymaps)
+        make_dpkg_status(os.path.join(home, 'dpkg-status'), options.packages)
+        os.environ['HOME'] = home
+
+        #Cold start: the frontend and every shipped plugin module
+        install_stubs()
+        begin = time.perf_counter()
+        import_mcp()
+        frontend = import_frontend()
+        from MythbuntuControlPanel.plugin import MCPPluginLoader
+        shipped = shipped_plugin_root(os.path.join(workdir, 'shipped'))
+        loader = MCPPluginLoader(shipped, modules=plugin_modules(shipped))
+        loader.reload_plugins()
+        import_ms = (time.perf_counter() - begin) * 1000
+        results.append({'name': 'cold import',
+                        'iterations': 1,
+                        'min_ms': import_ms, 'mean_ms': import_ms,
+                        'median_ms': import_ms, 'max_ms': import_ms,
+                        'deferred_imports_loaded': [name for name in DEFERRED_IMPORTS
+                                                    if name in sys.modules]})
+
+        #Frontend state machine with synthetic plugins
+        synthetic = make_plugin_root(os.path.join(workdir, 'synthetic'),
+                                     options.plugins, options.widgets, home)
+        for parallel in (False, True):
+            mode = 'parallel' if parallel else 'sequential'
+            cp = make_control_panel(frontend, synthetic, home, parallel)
+            results.append(measure('ControlPanel.refreshState[%s,first]' % mode,
+                                   lambda: (cp.refreshState(), wait_for_probes(cp)), 1))
+            results.append(measure('ControlPanel.refreshState[%s]' % mode,
+                                   lambda: (cp.refreshState(), wait_for_probes(cp)),
+                                   options.iterations))
+        #Startup showing the state saved by a previous run, until the
+        #window is usable and until the background probes are done
+        make_control_panel(frontend, synthetic, home, cached_state=True).refreshState()
+        cp = make_control_panel(frontend, synthetic, home, cached_state=True)
+        results.append(measure('ControlPanel.refreshState[cached,first]', cp.refreshState, 1))
+        results.append(measure('ControlPanel.refreshState[cached,probes]',
+                               lambda: wait_for_probes(cp), 1))
+        results.append(measure('ControlPanel.mainApply',
+                               lambda: cp.mainApply(None), options.iterations,
+                               touch_plugins(cp, options.widgets)))
+        results.append(measure('ControlPanel.mainApply[unchanged]',
+                               lambda: cp.mainApply(None), options.iterations))
+        results.append(measure('ControlPanel.refreshPlugin',
+                               lambda: cp.refreshPlugin(cp.plugins[0], force=True),
+                               options.iterations))
+
+        #Backend with synthetic plugins
+        from MythbuntuControlPanel.backend import Backend
+        backend = Backend()
+        request = {}
+        for index in range(options.plugins):
+            request['plg_synthetic_%d' % index] = dict(('item_%d' % number, True)
+                                                       for number in range(options.widgets))
+        results.append(measure('Backend.scriptedchanges',
+                               lambda: backend.scriptedchanges(dict(request), synthetic),
+                               options.iterations))
+        from MythbuntuControlPanel.backend import Job
+        results.append(measure('Backend.start_scriptedchanges[worker]',
+                               lambda: backend._run_job(Job('0', None, dict(request), synthetic)),
+                               options.iterations))
+
+        #Shipped plugins with fake widgets, systemd units and lsb-release
+        from MythbuntuControlPanel.packages import DpkgStatusIndex
+        index = DpkgStatusIndex(os.path.join(home, 'dpkg-status'),
+                                os.path.join(home, '.mythbuntu', 'dpkg-status.json'))
+        index.load()
+        for plugin in loader.find_plugin_instances():
+            name = plugin.getInformation('name')
+            try:
+                build_plugin(plugin, shipped)
+            except Exception as e:
+                results.append({'name': '%s.build_subpage' % name, 'error': str(e)})
+                continue
+            plugin.updateCache(FakeCache())
+            plugin.updateInstalledIndex(index)
+            if hasattr(plugin, 'LSB_RELEASE'):
+                plugin.LSB_RELEASE = os.path.join(home, 'lsb-release')
+            def capture(plugin=plugin):
+                plugin.updateSnapshot(synthetic_snapshot())
+                plugin.probeState()
+                plugin.captureState()
+                plugin.applyStateToGUI()
+            results.append(measure('%s.captureState' % name, capture, options.iterations))
+            results.append(measure('%s.compareState' % name, plugin.compareState, options.iterations))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {'python': platform.python_version(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'parameters': vars(options),
+            'results': results}
+
+def parse_argv():
+    '''Parse command line arguments, and return (options, args) pair.'''
+
+    parser = optparse.OptionParser()
+    parser.add_option ('--plugins', type='int', dest='plugins', default=20,
+        help='Number of synthetic plugins (default: 20)')
+    parser.add_option ('--widgets', type='int', dest='widgets', default=20,
+        help='Number of checkboxes on each synthetic plugin (default: 20)')
+    parser.add_option ('--repos', type='int', dest='repos', default=5000,
+        help='Number of lines in the synthetic repos.db (default: 5000)')
+    parser.add_option ('--keymaps', type='int', dest='keymaps', default=500,
+        help='Number of keymaps in the synthetic home folder (default: 500)')
+    parser.add_option ('--packages', type='int', dest='packages', default=3000,
+        help='Number of packages in the synthetic dpkg status file (default: 3000)')
+    parser.add_option ('--iterations', type='int', dest='iterations', default=10,
+        help='Times each benchmark is ran (default: 10)')
+    parser.add_option ('--import-budget', type='float', metavar='MS',
+        dest='import_budget', default=None,
+        help='Exit with status 1 if the cold import takes longer than MS, or if a module '
+             'that should be deferred was imported at startup')
+    parser.add_option ('-o', '--output', type='string', metavar='FILE',
+        dest='output', default=None,
+        help='Write the JSON report to FILE instead of stdout.')
+    (opts, args) = parser.parse_args()
+    return (opts, args)
+
+if __name__ == '__main__':
+    argv_options, argv_args = parse_argv()
+    report = run(argv_options)
+    if argv_options.output:
+        with open(argv_options.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    if argv_options.import_budget is not None:
+        cold = report['results'][0]
+        if cold['deferred_imports_loaded']:
+            sys.stderr.write('Imported at startup: %s\n' % ', '.join(cold['deferred_imports_loaded']))
+            sys.exit(1)
+        if cold['min_ms'] > argv_options.import_budget:
+            sys.stderr.write('Cold import took %.1f ms, over the budget of %.1f ms\n' %
+                             (cold['min_ms'], argv_options.import_budget))
+            sys.exit(1)
@@ -25,6 +25,16 @@
 import string
 import subprocess
 
+class _NoGUI():
+    """Stands in for a plugin whose page isn't built"""
+    def __getattr__(self,name):
+        return None
+
+def dictionary_packages(dictionary):
+    """Returns the package names of a dictionary, such as
+       get_role_dictionary, without needing the plugin's widgets"""
+    return list(dictionary(_NoGUI()))
+
 ####################
 # Type dictionaries: different installation types possible
 def get_install_type_dictionary(self):
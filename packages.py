@@ -0,0 +1,213 @@
+## -*- coding: utf-8 -*-
+#
+# «packages» - Package state shared by the MCP frontend and its plugins
+#
+# Copyright (C) 2020, Ted (MythTV forums member heyted)
+#
+# MCP is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 3 of the License, or at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this application; if not, write to the Free Software Foundation, Inc., 51
+# Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##################################################################################
+
+import logging
+import os
+import json
+import threading
+import contextlib
+
+#Files and directories whose changes mean the apt cache is out of date
+DPKG_STATUS = '/var/lib/dpkg/status'
+APT_LISTS = '/var/lib/apt/lists'
+
+_apt_pkg = None
+
+def load_apt_pkg(timer=None):
+    """Imports and initializes apt_pkg the first time a cache is opened,
+       so starting up doesn't pay for it.  The cost is recorded as the
+       apt_pkg.init phase of timer, if given"""
+    global _apt_pkg
+    if _apt_pkg is None:
+        with _phase(timer, "apt_pkg.init"):
+            import apt_pkg
+            apt_pkg.init()
+        _apt_pkg = apt_pkg
+    return _apt_pkg
+
+def _phase(timer,name):
+    """Returns timer's context manager for phase name, or one doing nothing"""
+    if timer is None:
+        return contextlib.nullcontext()
+    return timer.phase(name)
+
+def file_stamp(path):
+    """Returns a (inode, mtime, size) stamp of path, or None if it is missing"""
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    return (info.st_ino, info.st_mtime_ns, info.st_size)
+
+class PackageCache():
+    """Keeps an apt_pkg.Cache alive between refreshes.  The cache is only
+       opened again when the dpkg status file or the apt lists changed
+       since it was last built."""
+
+    def __init__(self,watched=(DPKG_STATUS, APT_LISTS),timer=None):
+        """timer is an optional PhaseTimer recording apt_pkg.init and
+           every opening of the cache"""
+        self._watched = watched
+        self._timer = timer
+        self._stamps = None
+        self._cache = None
+
+    def _current_stamps(self):
+        return tuple(file_stamp(path) for path in self._watched)
+
+    def stamps(self):
+        """Returns stamps of the watched files, which differ from earlier
+           ones once the package state changed"""
+        return self._current_stamps()
+
+    def lazy(self):
+        """Returns a stand-in for the cache that only opens it once
+           something actually looks a package up"""
+        return LazyCache(self)
+
+    def get(self):
+        """Returns a tuple (cache, changed) where changed is False if the
+           cache was reused from the previous call"""
+        stamps = self._current_stamps()
+        if self._cache is not None and stamps == self._stamps:
+            logging.debug("Reusing apt cache, package state is unchanged")
+            return (self._cache, False)
+        logging.debug("Opening apt cache")
+        apt_pkg = load_apt_pkg(self._timer)
+        with _phase(self._timer, "apt cache open"):
+            self._cache = apt_pkg.Cache()
+        self._stamps = stamps
+        return (self._cache, True)
+
+class LazyCache():
+    """Stand-in for an apt_pkg.Cache handed to plugins.  The real cache is
+       fetched from a PackageCache on first use, so refreshes that can be
+       answered by the dpkg status index never pay for opening it."""
+
+    def __init__(self,package_cache):
+        self._package_cache = package_cache
+        self._cache = None
+        self._lock = threading.Lock()
+
+    def _get(self):
+        with self._lock:
+            if self._cache is None:
+                (self._cache, changed) = self._package_cache.get()
+        return self._cache
+
+    def __getitem__(self,key):
+        return self._get()[key]
+
+    def __contains__(self,key):
+        return key in self._get()
+
+    def __iter__(self):
+        return iter(self._get().packages)
+
+    def __getattr__(self,name):
+        return getattr(self._get(), name)
+
+class DpkgStatusIndex():
+    """A compact name -> installed version index of the dpkg status file.
+       The index is kept on disk and only parsed again when the status
+       file changed, which is much cheaper than opening the apt cache
+       just to tell which packages are installed."""
+
+    #dpkg states that mean there is no installed version
+    NOT_INSTALLED = ('not-installed', 'config-files')
+
+    def __init__(self,status=DPKG_STATUS,index_file=None):
+        self._status = status
+        if index_file is None:
+            index_file = os.path.join(os.path.expanduser('~'), '.mythbuntu', 'dpkg-status.json')
+        self._index_file = index_file
+        self._stamp = None
+        self._installed = {}
+
+    def _parse(self):
+        """Stream parses the status file"""
+        installed = {}
+        fields = {}
+        with open(self._status, encoding='utf-8', errors='replace') as status:
+            for line in status:
+                if line == '\n':
+                    self._add_stanza(installed, fields)
+                    fields = {}
+                elif not line[0].isspace() and ':' in line:
+                    (key, value) = line.split(':', 1)
+                    if key in ('Package', 'Status', 'Version', 'Architecture'):
+                        fields[key] = value.strip()
+        self._add_stanza(installed, fields)
+        return installed
+
+    def _add_stanza(self,installed,fields):
+        if 'Package' not in fields or 'Status' not in fields:
+            return
+        if fields['Status'].split()[-1] in self.NOT_INSTALLED:
+            return
+        version = fields.get('Version', '')
+        installed[fields['Package']] = version
+        if 'Architecture' in fields:
+            installed[fields['Package'] + ':' + fields['Architecture']] = version
+
+    def _read_index(self,stamp):
+        """Returns the on disk index if it was built from the same status file"""
+        try:
+            with open(self._index_file) as index:
+                data = json.load(index)
+        except (OSError, ValueError):
+            return None
+        if data.get('stamp') != list(stamp):
+            return None
+        return data.get('installed')
+
+    def _write_index(self,stamp,installed):
+        try:
+            os.makedirs(os.path.dirname(self._index_file), exist_ok=True)
+            temporary = self._index_file + '.tmp'
+            with open(temporary, 'w') as index:
+                json.dump({'stamp': list(stamp), 'installed': installed}, index)
+            os.replace(temporary, self._index_file)
+        except OSError as e:
+            logging.debug("Unable to write dpkg status index: %s" % e)
+
+    def load(self):
+        """Brings the index up to date with the status file.  Returns
+           True if the installed packages may have changed"""
+        stamp = file_stamp(self._status)
+        if stamp is None:
+            self._stamp = None
+            self._installed = {}
+            return True
+        if stamp == self._stamp:
+            return False
+        installed = self._read_index(stamp)
+        if installed is None:
+            logging.debug("Parsing %s" % self._status)
+            installed = self._parse()
+            self._write_index(stamp, installed)
+        self._installed = installed
+        self._stamp = stamp
+        return True
+
+    def is_installed(self,package):
+        """Determines if a package is installed"""
+        return package in self._installed
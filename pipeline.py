@@ -0,0 +1,102 @@
+## -*- coding: utf-8 -*-
+#
+# «pipeline» - The stages of an apply, ran without blocking the main loop
+#
+# Copyright (C) 2020, Ted (MythTV forums member heyted)
+#
+# MCP is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 3 of the License, or at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this application; if not, write to the Free Software Foundation, Inc., 51
+# Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##################################################################################
+
+import logging
+
+from gi.repository import GLib
+
+#Translation Support
+from gettext import gettext as _
+
+class ApplyStage():
+    """A step of an ApplyPipeline.  start is called with the pipeline and
+       must return right away, calling finish_stage on the pipeline once
+       the work it started is over.  weight is the share of the overall
+       progress the stage takes"""
+
+    def __init__(self,name,start,weight=1):
+        self.name = name
+        self.start = start
+        self.weight = weight
+
+class ApplyPipeline():
+    """Runs the stages of an apply one after another from the main loop.
+       Progress of every stage goes to progress(text, percent) as a share
+       of the whole apply, with the stage name in front of the text.
+       cancel stops the pipeline before its next stage, and finished is
+       called with False if it was cancelled"""
+
+    def __init__(self,stages,progress,finished):
+        self.stages = list(stages)
+        self._progress = progress
+        self._finished = finished
+        self._total = float(sum(stage.weight for stage in self.stages)) or 1.0
+        self._done_weight = 0
+        self._current = None
+        self._percent = 0
+        self._cancelled = False
+
+    def start(self):
+        """Starts the first stage"""
+        GLib.idle_add(self._next)
+
+    def cancel(self):
+        """Asks the pipeline not to start any more stages"""
+        self._cancelled = True
+
+    def stage_progress(self,text,percent=None):
+        """Progress of the current stage.  text or percent may be None
+           to keep the last one"""
+        if self._current is None:
+            return True
+        if percent is not None:
+            try:
+                self._percent = min(max(float(percent), 0), 100)
+            except ValueError:
+                pass
+        overall = (self._done_weight + self._current.weight * self._percent / 100) / self._total * 100
+        if text is not None:
+            text = self._current.name + ': ' + text
+        self._progress(text, overall)
+        return True
+
+    def finish_stage(self):
+        """Called by the current stage once its work is over"""
+        if self._current is None:
+            return
+        logging.debug("Finished apply stage: %s" % self._current.name)
+        self._done_weight += self._current.weight
+        self._current = None
+        GLib.idle_add(self._next)
+
+    def _next(self):
+        if len(self.stages) == 0 or self._cancelled:
+            if self._cancelled:
+                logging.debug("Apply cancelled before: %s" %
+                              ', '.join(stage.name for stage in self.stages))
+            self._finished(not self._cancelled)
+            return False
+        self._current = self.stages.pop(0)
+        self._percent = 0
+        logging.debug("Starting apply stage: %s" % self._current.name)
+        self.stage_progress(_("Starting"), 0)
+        self._current.start(self)
+        return False
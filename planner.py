@@ -0,0 +1,73 @@
+## -*- coding: utf-8 -*-
+#
+# «planner» - Orders the changes of an apply into the fewest apt transactions
+#
+# Copyright (C) 2020, Ted (MythTV forums member heyted)
+#
+# MCP is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 3 of the License, or at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this application; if not, write to the Free Software Foundation, Inc., 51
+# Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##################################################################################
+
+import logging
+
+class TransactionPlan():
+    """Splits a ChangeSet into the steps of an apply, in this order:
+        sources: root changes that edit the apt sources
+        update: whether to refresh the package lists, done once if a
+                plugin asked for it or the sources changed
+        install, remove: every package change, for a single aptdaemon
+                transaction
+        independent: root changes that can run alongside the packages
+        dependent: root changes that have to wait for the packages
+        user: changes that happen as a user
+       so new sources are known to apt before packages are looked up."""
+
+    def __init__(self,changes,plugins):
+        self.changes = changes
+        self.sources = {}
+        self.independent = {}
+        self.dependent = {}
+        self.install = list(changes.install)
+        self.remove = list(changes.remove)
+        self.allow_unauth = changes.request_unauth
+        self.user = dict(changes.reconfigure_user)
+        package_modules = changes.packageModules()
+        for plugin in plugins:
+            module = plugin.getInformation("module")
+            if module not in changes.reconfigure_root:
+                continue
+            reconfigure = changes.reconfigure_root[module]
+            if plugin.changesSources(reconfigure):
+                self.sources[module] = reconfigure
+            elif not self.hasPackages() or \
+                 module in package_modules or \
+                 plugin.dependsOnPackages(reconfigure):
+                self.dependent[module] = reconfigure
+            else:
+                self.independent[module] = reconfigure
+        self.update = changes.request_update or len(self.sources) > 0
+        logging.debug("Planned apply: sources %s, update %s, %d packages, independent %s, dependent %s" %
+                      (list(self.sources), self.update, len(self.install) + len(self.remove),
+                       list(self.independent), list(self.dependent)))
+
+    def hasPackages(self):
+        """Returns whether there are packages to install or remove"""
+        return len(self.install) > 0 or len(self.remove) > 0
+
+    def rootChanges(self):
+        """Returns the root changes that aren't source changes, for
+           callers that run them in one go after the packages"""
+        reconfigure = dict(self.independent)
+        reconfigure.update(self.dependent)
+        return reconfigure
@@ -24,9 +24,10 @@
 
 from MythbuntuControlPanel.plugin import MCPPlugin
 from gi.repository import Gtk
-import os, string, logging, configparser, subprocess, time
+import os, string, logging, configparser, subprocess
 
 from MythbuntuControlPanel.dictionaries import *
+from MythbuntuControlPanel.packages import DPKG_STATUS
 
 class MythPluginsPlugin(MCPPlugin):
     """A tool for enabling MythTV plugins"""
@@ -40,16 +41,19 @@ class MythPluginsPlugin(MCPPlugin):
         self.config = configparser.RawConfigParser()
         MCPPlugin.__init__(self,information)
 
-    def captureState(self):
+    def getWatchedPaths(self):
+        """Returns the paths the captured state depends on"""
+        return [DPKG_STATUS, '/usr/share/applications/mythtv_web_app.desktop']
+
+    def probeState(self):
         """Determines the state of the items managed by this plugin
            and stores it into the plugin's own internal structures"""
-        #Dictionaries
+        #Dictionaries, keyed by package so no widgets are needed
         self.dictionary_state={}
-        list = get_frontend_plugin_dictionary(self)
-        for item in list:
-            self.dictionary_state[list[item]]=self.query_installed(item)
+        for item in dictionary_packages(get_frontend_plugin_dictionary):
+            self.dictionary_state[item]=self.query_installed(item)
         #Web app launcher
-        if os.path.isfile("/usr/share/applications/mythtv_web_app.desktop"):
+        if self.snapshot.isfile("/usr/share/applications/mythtv_web_app.desktop"):
             self.web_app_l_state=True
         else:
             self.web_app_l_state=False
@@ -58,18 +62,18 @@ class MythPluginsPlugin(MCPPlugin):
         """Takes the current state information and sets the GUI
            for this plugin"""
         #Load the detected dictionary
+        list = get_frontend_plugin_dictionary(self)
         for item in self.dictionary_state:
-            item.set_active(self.dictionary_state[item])
+            list[item].set_active(self.dictionary_state[item])
         #Web app launcher
         self.webapp_checkbox.set_active(self.web_app_l_state)
 
     def on_web_app_select(self, widget, data=None):
         """Backend IP entry available if web app launcher selected"""
         if self.webapp_checkbox.get_active() and not self.web_app_l_state:
-            be_state = subprocess.run(['systemctl', 'is-active', '--quiet', 'mythtv-backend']).returncode
             home = os.environ['HOME']
             self.backend_ip_entry.show()
-            if be_state == 0:
+            if self.snapshot.unit_active('mythtv-backend'):
                 self.backend_ip_entry.set_text('localhost')
             elif os.path.isfile(home + '/.mythtv/config.xml'):
                 import xml.etree.ElementTree as et
@@ -82,24 +86,50 @@ class MythPluginsPlugin(MCPPlugin):
 
     def compareState(self):
         """Determines what items have been modified on this plugin"""
+        installed = {}
+        list = get_frontend_plugin_dictionary(self)
+        for item in list:
+            installed[item] = list[item].get_active()
+        self._compareChoices(installed,self.webapp_checkbox.get_active(),
+                             self.backend_ip_entry.get_text())
+
+    def compareProfile(self,settings):
+        """Determines what items need to change to match a provisioning
+           profile.  Recognized keys are the plugin package names, such
+           as mythmusic, web_app and web_app_backend, the host of the
+           backend the web app launcher points to"""
+        installed = {}
+        for item in self.dictionary_state:
+            installed[item] = settings.getboolean(item, self.dictionary_state[item])
+        host = settings.get('web_app_backend', '')
+        if host == '' and self.snapshot.unit_active('mythtv-backend'):
+            host = 'localhost'
+        self._compareChoices(installed,settings.getboolean('web_app', self.web_app_l_state),host)
+
+    def _compareChoices(self,installed,web_app,host):
+        """Marks the changes needed to go from the probed state to the
+           chosen one.  installed maps plugin packages to whether they
+           should be installed"""
         #Prepare for state capturing
         MCPPlugin.clearParentState(self)
         #Installable items
-        list = get_frontend_plugin_dictionary(self)
-        for item in list:
-            if list[item].get_active() != self.dictionary_state[list[item]]:
-                if list[item].get_active():
+        for item in installed:
+            if installed[item] != self.dictionary_state[item]:
+                if installed[item]:
                     self._markInstall(item)
                 else:
                     self._markRemove(item)
         #Web app launcher
-        web_app_l_state_now = self.webapp_checkbox.get_active()
-        if self.web_app_l_state != web_app_l_state_now:
-            if web_app_l_state_now:
-                self._markReconfigureRoot("web_app_launcher",self.backend_ip_entry.get_text())
+        if self.web_app_l_state != web_app:
+            if web_app:
+                self._markReconfigureRoot("web_app_launcher",host)
             else:
                 self._markReconfigureRoot("web_app_launcher","remove")
 
+    def getScriptedResources(self,reconfigure):
+        """The web app entry is only a desktop file"""
+        return [(['web_app_launcher'], ['/usr/share/applications/mythtv_web_app.desktop'])]
+
     def root_scripted_changes(self,reconfigure):
         """System-wide changes that need root access to be applied.
            This function is ran by the dbus backend"""
@@ -108,16 +138,12 @@ class MythPluginsPlugin(MCPPlugin):
                 if reconfigure[item] != "remove":
                     host = reconfigure[item]
                     self.emit_progress("Checking if backend is reachable at location entered", 10)
-                    time.sleep(2)
                     if host == 'Backend IP' or host == '':
                         self.emit_progress("IP address or host name was not entered (aborting)", 0)
-                        time.sleep(2)
                     elif subprocess.run(["nc", "-z", host, "6543"]).returncode != 0:
                         self.emit_progress("Backend not reachable at location entered (aborting)", 0)
-                        time.sleep(2)
                     else:
                         self.emit_progress("Creating MythTV Web App applications menu entry", 50)
-                        time.sleep(2)
                         with open("/usr/share/applications/mythtv_web_app.desktop", 'w') as txt_file:
                             txt_file.write('[Desktop Entry]\n')
                             txt_file.write('Name=MythTV Web App\n')
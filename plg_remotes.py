@@ -22,8 +22,7 @@
 
 from MythbuntuControlPanel.plugin import MCPPlugin
 import os
-import urllib3
-import shutil, time, subprocess
+import shutil, subprocess
 
 class RemotesPlugin(MCPPlugin):
     """A tool for configuring remote controls"""
@@ -36,15 +35,20 @@ class RemotesPlugin(MCPPlugin):
         information["ui"] = "tab_remotes"
         MCPPlugin.__init__(self,information)
 
-    def captureState(self):
+    def getWatchedPaths(self):
+        """Returns the paths the captured state depends on"""
+        return ['/lib/udev/rc_keymaps', '$HOME/*.toml', '/usr/bin/mcpremote',
+                '/usr/bin/ir-keytable']
+
+    def probeState(self):
         """Determines the state of the items managed by this plugin"""
-        if shutil.which("ir-keytable"):
+        if self.snapshot.which("ir-keytable"):
             self.ir_keytable_installed_state=True
         else:
             self.ir_keytable_installed_state=False
 
-        if os.path.exists("/lib/udev/rc_keymaps"):
-            self.default_keyc_fls = os.listdir('/lib/udev/rc_keymaps')
+        if self.snapshot.exists("/lib/udev/rc_keymaps"):
+            self.default_keyc_fls = self.snapshot.listdir('/lib/udev/rc_keymaps')
         else:
             self.default_keyc_fls = []
         self.default_keyc_fls = [dir_entry[:-5]
@@ -52,27 +56,30 @@ class RemotesPlugin(MCPPlugin):
         self.default_keyc_fls.sort()
         if len(self.default_keyc_fls) == 0:
             self.default_keyc_fls = ['None installed']
-        self.keycode_d_box.get_model().clear()
-        for item in self.default_keyc_fls:
-            self.builder.get_object('keycode_d_box').append_text(item)
 
         self.home = os.environ['HOME']
         self.home_keyc_fls = []
-        for item in os.listdir(self.home):
+        for item in self.snapshot.listdir(self.home):
             if item.endswith('.toml'):
                 self.home_keyc_fls.append(item[:-5])
         self.home_keyc_fls.sort()
         if len(self.home_keyc_fls) == 0:
             self.home_keyc_fls = ['None found in home folder']
-        self.keycode_m_box.get_model().clear()
-        for item in self.home_keyc_fls:
-            self.builder.get_object('keycode_m_box').append_text(item)
 
-        if os.path.exists("/usr/bin/mcpremote"):
+        if self.snapshot.exists("/usr/bin/mcpremote"):
             self.mcpremote_installed_state=True
         else:
             self.mcpremote_installed_state=False
 
+    def captureState(self):
+        """Fills the keycode file lists found by probeState"""
+        self.keycode_d_box.get_model().clear()
+        for item in self.default_keyc_fls:
+            self.builder.get_object('keycode_d_box').append_text(item)
+        self.keycode_m_box.get_model().clear()
+        for item in self.home_keyc_fls:
+            self.builder.get_object('keycode_m_box').append_text(item)
+
     def applyStateToGUI(self):
         """Takes the current state information and sets the GUI
            for this plugin"""
@@ -90,25 +97,66 @@ class RemotesPlugin(MCPPlugin):
 
     def compareState(self):
         """Determines what items have been modified on this plugin"""
+        if self.copy_dkcf.get_active():
+            copy_default = self.keycode_d_box.get_active_text()
+        else:
+            copy_default = None
+        self._compareChoices(self.enable_ir_kt.get_active(),
+                             copy_default,
+                             self.keycode_m_box.get_active_text(),
+                             self.mod_kcf.get_active(),
+                             self.temp_set_active.get_active(),
+                             self.perm_set_active.get_active(),
+                             self.enable_mcpr.get_active())
+
+    def compareProfile(self,settings):
+        """Determines what items need to change to match a provisioning
+           profile.  Recognized keys are ir_keytable, copy_keymap (a
+           keymap of /lib/udev/rc_keymaps to copy to the home folder),
+           keymap (a keymap in the home folder), modify_keymap,
+           activate_keymap (no, temporary or permanent) and mcpremote"""
+        copy_default = settings.get('copy_keymap', None)
+        if copy_default is not None and copy_default not in self.default_keyc_fls:
+            raise ValueError("copy_keymap " + copy_default + " is not in /lib/udev/rc_keymaps")
+        keymap = settings.get('keymap', None)
+        if keymap is not None and keymap not in self.home_keyc_fls:
+            raise ValueError("keymap " + keymap + " is not in the home folder")
+        activate = settings.get('activate_keymap', 'no')
+        if activate not in ('no', 'temporary', 'permanent'):
+            raise ValueError("activate_keymap must be no, temporary or permanent, not " + activate)
+        if keymap is None:
+            keymap = 'None found in home folder'
+        self._compareChoices(settings.getboolean('ir_keytable', self.ir_keytable_installed_state),
+                             copy_default, keymap,
+                             settings.getboolean('modify_keymap', False),
+                             activate == 'temporary',
+                             activate == 'permanent',
+                             settings.getboolean('mcpremote', self.mcpremote_installed_state))
+
+    def _compareChoices(self,ir_keytable,copy_default,keymap,modify,temporary,permanent,mcpremote):
+        """Marks the changes needed to go from the probed state to the
+           chosen one.  copy_default is the default keymap to copy to the
+           home folder or None, and keymap is the one in the home folder
+           to modify or set active"""
         #Prepare for state capturing
         MCPPlugin.clearParentState(self)
-        if self.enable_ir_kt.get_active() != self.ir_keytable_installed_state:
-            if self.enable_ir_kt.get_active():
+        if ir_keytable != self.ir_keytable_installed_state:
+            if ir_keytable:
                 self._markInstall('ir-keytable')
             else:
                 self._markRemove('ir-keytable')
-        if self.copy_dkcf.get_active():
-            self._markReconfigureUser("copy_default_kcf",self.keycode_d_box.get_active_text())
-        if self.mod_kcf.get_active() and self.keycode_m_box.get_active_text() != 'None found in home folder':
-            self._markReconfigureUser("modify_kcf",self.keycode_m_box.get_active_text())
-        if self.temp_set_active.get_active() and self.keycode_m_box.get_active_text() != 'None found in home folder':
-            tmp_set_file_path = self.home + '/' + self.keycode_m_box.get_active_text() + ".toml"
+        if copy_default is not None:
+            self._markReconfigureUser("copy_default_kcf",copy_default)
+        if modify and keymap != 'None found in home folder':
+            self._markReconfigureUser("modify_kcf",keymap)
+        if temporary and keymap != 'None found in home folder':
+            tmp_set_file_path = self.home + '/' + keymap + ".toml"
             self._markReconfigureRoot("tmp_set_active",tmp_set_file_path)
-        if self.perm_set_active.get_active() and self.keycode_m_box.get_active_text() != 'None found in home folder':
-            perm_set_file_path = self.home + '/' + self.keycode_m_box.get_active_text() + ".toml"
+        if permanent and keymap != 'None found in home folder':
+            perm_set_file_path = self.home + '/' + keymap + ".toml"
             self._markReconfigureRoot("perm_set_active",perm_set_file_path)
-        if self.enable_mcpr.get_active() != self.mcpremote_installed_state:
-            if self.enable_mcpr.get_active():
+        if mcpremote != self.mcpremote_installed_state:
+            if mcpremote:
                 self._markReconfigureRoot("enable_mcpremote", self.home + '/.mythbuntu/mcpremote_amd64.deb')
             else:
                 self._markReconfigureRoot("enable_mcpremote", False)
@@ -126,7 +174,6 @@ class RemotesPlugin(MCPPlugin):
                 mod_kc_file_nm = reconfigure["modify_kcf"] + ".toml"
                 if os.path.exists(home+'/'+mod_kc_file_nm):
                     self.emit_progress("Modifying file", 50)
-                    time.sleep(1)
                     to_replace = ("KEY_INFO","KEY_EPG","KEY_SELECT","KEY_RECORD","KEY_CHANNELUP",
                     "KEY_CHANNELDOWN","KEY_PLAY","KEY_PAUSE","KEY_REWIND","KEY_FASTFORWARD",
                     "KEY_PREVIOUS","KEY_NEXT","KEY_ZOOM","KEY_STOP","KEY_NUMERIC_1",
@@ -156,6 +203,13 @@ class RemotesPlugin(MCPPlugin):
                     writing_file.write(mod_kc_file)
                     writing_file.close()
 
+    def getScriptedResources(self,reconfigure):
+        """Loading a keycode file and installing MCP Remote are independent"""
+        return [(['tmp_set_active'], ['ir-keytable']),
+                (['perm_set_active'], ['ir-keytable', '/etc/rc_keymaps', '/etc/rc_maps.cfg']),
+                (['enable_mcpremote'], ['/var/lib/dpkg', '/usr/share/applications/mcpremote.desktop',
+                                        '/usr/share/mythbuntu/plugins'])]
+
     def root_scripted_changes(self,reconfigure):
         """System-wide changes that need root access to be applied.
            This function is ran by the dbus backend"""
@@ -163,20 +217,16 @@ class RemotesPlugin(MCPPlugin):
             if item == 'tmp_set_active':
                 if os.path.exists(reconfigure["tmp_set_active"]):
                     self.emit_progress("Setting keycode file active", 50)
-                    time.sleep(2)
                     subprocess.run(['ir-keytable', '-c', '-w', reconfigure["tmp_set_active"]])
                     self.emit_progress("Done", 100)
-                    time.sleep(1)
             if item == 'perm_set_active':
                 if os.path.exists(reconfigure["perm_set_active"]):
                     self.emit_progress("Setting keycode file active", 30)
-                    time.sleep(2)
                     subprocess.run(['ir-keytable', '-c', '-w', reconfigure["perm_set_active"]])
                     if os.path.exists('/etc/rc_keymaps'):
                         shutil.copyfile(reconfigure["perm_set_active"], "/etc/rc_keymaps/mcp_kcf.toml")
                         if os.path.exists('/etc/rc_maps.cfg'):
                             self.emit_progress("Modifying rc_maps.cfg", 60)
-                            time.sleep(2)
                             cfg_file = open("/etc/rc_maps.cfg", "r")
                             mod_cfg_file = ""
                             for line in cfg_file:
@@ -194,19 +244,17 @@ class RemotesPlugin(MCPPlugin):
                             writing_file.write(mod_cfg_file)
                             writing_file.close()
                             self.emit_progress("Done", 100)
-                            time.sleep(1)
                         else:
                             self.emit_progress("Expected file /etc/rc_maps.cfg not found", 0)
-                            time.sleep(3)
                     else:
                         self.emit_progress("Expected path /etc/rc_keymaps not found", 0)
-                        time.sleep(3)
             if item == 'enable_mcpremote':
                 if reconfigure["enable_mcpremote"]:
                     self.emit_progress("Downloading MCP Remote", 20)
-                    time.sleep(1)
                     deb_file = reconfigure["enable_mcpremote"]
                     url = 'https://github.com/mythcp/mcpremote/releases/latest/download/mcpremote_amd64.deb'
+                    #only pay for the network stack when downloading
+                    import urllib3
                     http = urllib3.PoolManager()
                     if os.path.exists(deb_file):
                         os.remove(deb_file)
@@ -218,21 +266,16 @@ class RemotesPlugin(MCPPlugin):
                         if os.path.exists(deb_file):
                             os.remove(deb_file)
                         self.emit_progress('Unable to download MCP Remote', 0)
-                        time.sleep(2)
                     if os.path.exists(deb_file):
                         self.emit_progress("Installing MCP Remote", 77)
-                        time.sleep(1)
                         cmd = 'TMPDEB="$(mktemp)" && cp ' + deb_file + ' "$TMPDEB" && sudo dpkg -i "$TMPDEB"'
                         subprocess.run(cmd, shell=True)
                         if os.path.exists("/usr/bin/mcpremote"):
                             self.emit_progress('MCP Remote successfully installed\nRestart MCP', 100)
-                            time.sleep(3)
                         else:
                             self.emit_progress('Unable to install MCP Remote', 0)
-                            time.sleep(2)
                 else:
                     self.emit_progress('Removing MCP Remote', 50)
-                    time.sleep(1)
                     subprocess.run(['dpkg', '-r', 'mcpremote'])
                     if os.path.exists("/usr/share/applications/mcpremote.desktop"):
                         os.remove("/usr/share/applications/mcpremote.desktop")
@@ -25,10 +25,8 @@ from MythbuntuControlPanel.plugin import MCPPlugin
 import os
 import re
 import subprocess
-import urllib.request, urllib.error, urllib.parse
 import shutil
 import configparser
-import time
 import fnmatch
 
 class MythbuntuReposPlugin(MCPPlugin):
@@ -45,6 +43,7 @@ class MythbuntuReposPlugin(MCPPlugin):
         information["ui"] = "tab_repos"
         MCPPlugin.__init__(self, information)
         self.CONFIGFILE = "/etc/default/mythbuntu-repos"
+        self.LSB_RELEASE = "/etc/lsb-release"
         self.USERHOME = os.path.expanduser("~")
         if not os.path.isdir(self.USERHOME+"/.mythbuntu"):
             os.mkdir(self.USERHOME+"/.mythbuntu")
@@ -58,16 +57,21 @@ class MythbuntuReposPlugin(MCPPlugin):
                 pass
         self.config = configparser.ConfigParser()
 
+    def getWatchedPaths(self):
+        """Returns the paths the captured state depends on"""
+        return ['/etc/apt/sources.list.d', self.CONFIGFILE,
+                self.USERHOME + '/.mythbuntu/repos.db']
+
     #Set mythtv versions
-    def captureState(self):
+    def probeState(self):
         """Determines the state of the items managed by this plugin
            and stores it into the plugin's own internal structures"""
         self.versions = []
-        for line in open("/etc/lsb-release"):
+        for line in open(self.LSB_RELEASE):
             if "DISTRIB_CODENAME" in line:
                 line = line.strip("\n")
                 throwaway, distro = line.split("=")
-        NumRepos = 0
+        self.NumRepos = 0
 
         if os.path.isfile(self.USERHOME+"/.mythbuntu/repos.db"):
             self.versions = []
@@ -77,7 +81,7 @@ class MythbuntuReposPlugin(MCPPlugin):
                     release, version = line.split("\t")
                     if not version in self.versions:
                         self.versions.append(version)
-                    NumRepos += 1
+                    self.NumRepos += 1
                 elif "MYTHTV_RELEASE" in line:
                     line = line.strip("\n")
                     VerName, self.CurVer = line.split("\t")
@@ -87,35 +91,13 @@ class MythbuntuReposPlugin(MCPPlugin):
                 elif "URL" in line:
                     line = line.strip("\n")
                     discard, self.DOWNLOADURL = line.split("\t")
-            self.download_repo_db_label.hide()
-            self.mythtv_updates_alignment.show()
-            self.mythtv_updates_ckbox_alignment.show()
-            self.mythtv_updates_label.show()
-            self.mythtv_updates_checkbox.show()
-            self.repobox.show()
-            self.hseparator5.show()
-            self.hseparator6.show()
-            self.footer_alignment.show()
-        if NumRepos == 0:
+        if self.NumRepos == 0:
             self.versions.append('0')
             self.CurVer = '0'
-            self.download_repo_db_label.show()
-            self.mythtv_updates_alignment.hide()
-            self.mythtv_updates_ckbox_alignment.hide()
-            self.mythtv_updates_label.hide()
-            self.mythtv_updates_checkbox.hide()
-            self.repobox.hide()
-            self.hseparator5.hide()
-            self.hseparator6.hide()
-            self.footer_alignment.hide()
-            self.trunk_block.hide()
             self.DOWNLOADURL = 'https://raw.githubusercontent.com/mythcp/mythbuntu-control-panel/master/repos.db'
-            
+
         self.changes = {}
-        self.repobox.get_model().clear()
-        for item in self.versions:
-            self.builder.get_object('repobox').append_text(item)
-        if os.path.exists(self.CONFIGFILE):
+        if self.snapshot.exists(self.CONFIGFILE):
             self.config.read(self.CONFIGFILE)
         try:
             self.changes['MythTVUpdatesActivated'] = self.config.getboolean("cfg", "ActivateMythTVUpdates")
@@ -127,11 +109,38 @@ class MythbuntuReposPlugin(MCPPlugin):
             self.changes['MythTVUpdatesRepo'] = self.versions[0]
         #MCP Updates PPA current state
         self.MCPUpdatesActivated = False # False unless determined true below
-        for file in os.listdir('/etc/apt/sources.list.d'):
+        for file in self.snapshot.listdir('/etc/apt/sources.list.d'):
             if fnmatch.fnmatch(file, 'mythcp-ubuntu-mcp*'):
                 self.MCPUpdatesActivated = True
                 break
 
+    def captureState(self):
+        """Shows the widgets that match the probed repos.db state"""
+        if self.NumRepos == 0:
+            self.download_repo_db_label.show()
+            self.mythtv_updates_alignment.hide()
+            self.mythtv_updates_ckbox_alignment.hide()
+            self.mythtv_updates_label.hide()
+            self.mythtv_updates_checkbox.hide()
+            self.repobox.hide()
+            self.hseparator5.hide()
+            self.hseparator6.hide()
+            self.footer_alignment.hide()
+            self.trunk_block.hide()
+        else:
+            self.download_repo_db_label.hide()
+            self.mythtv_updates_alignment.show()
+            self.mythtv_updates_ckbox_alignment.show()
+            self.mythtv_updates_label.show()
+            self.mythtv_updates_checkbox.show()
+            self.repobox.show()
+            self.hseparator5.show()
+            self.hseparator6.show()
+            self.footer_alignment.show()
+        self.repobox.get_model().clear()
+        for item in self.versions:
+            self.builder.get_object('repobox').append_text(item)
+
     def applyStateToGUI(self):
         """Takes the current state information and sets the GUI
            for this plugin"""
@@ -178,30 +187,56 @@ class MythbuntuReposPlugin(MCPPlugin):
 
     def compareState(self):
         """Determines what items have been modified on this plugin"""
+        self._compareChoices(self.mythtv_updates_checkbox.get_active(),
+                             self.repobox.get_active_text(),
+                             self.repobox.get_sensitive(),
+                             self.dev_password_entry.get_text(),
+                             self.mcp_updates_checkbox.get_active())
+
+    def compareProfile(self, settings):
+        """Determines what items need to change to match a provisioning
+           profile.  Recognized keys are mythtv_updates, mythtv_version,
+           trunk_password (needed for versions newer than the current
+           release) and mcp_updates"""
+        activated = settings.getboolean('mythtv_updates', self.changes['MythTVUpdatesActivated'])
+        version = settings.get('mythtv_version', self.changes['MythTVUpdatesRepo'])
+        if version not in self.versions:
+            raise ValueError("mythtv_version " + version + " is not one of " + ', '.join(self.versions))
+        password = settings.get('trunk_password', '')
+        if activated and self.convertVersion(version) > self.CurVer and password != self.TRUNKPASS:
+            raise ValueError("mythtv_version " + version + " needs the trunk_password")
+        self._compareChoices(activated, version, activated, password,
+                             settings.getboolean('mcp_updates', self.MCPUpdatesActivated))
+
+    def _compareChoices(self, activated, version, selectable, password, mcp):
+        """Marks the changes needed to go from the probed state to the
+           chosen one.  selectable is whether a version may be chosen"""
         MCPPlugin.clearParentState(self)
         SENDLIST = False
-        SELVER = self.convertVersion(self.repobox.get_active_text())
-        if self.mythtv_updates_checkbox.get_active() != self.changes['MythTVUpdatesActivated'] and self.mythtv_updates_checkbox.get_active() == False:
-            self._markReconfigureRoot('MythTV-Updates-Activated', self.mythtv_updates_checkbox.get_active())
+        SELVER = self.convertVersion(version)
+        if activated != self.changes['MythTVUpdatesActivated'] and activated == False:
+            self._markReconfigureRoot('MythTV-Updates-Activated', activated)
             SENDLIST = True
-        if self.repobox.get_sensitive() == True:
-            if self.repobox.get_active_text() != self.changes['MythTVUpdatesRepo'] or self.mythtv_updates_checkbox.get_active() != self.changes['MythTVUpdatesActivated']:
-                if (SELVER > self.CurVer and self.dev_password_entry.get_text() == self.TRUNKPASS) or SELVER <= self.CurVer:
-                    self._markReconfigureRoot('MythTV-Updates-Repo', self.repobox.get_active_text())
-                    self._markReconfigureRoot('MythTV-Updates-Activated', self.mythtv_updates_checkbox.get_active())
+        if selectable == True:
+            if version != self.changes['MythTVUpdatesRepo'] or activated != self.changes['MythTVUpdatesActivated']:
+                if (SELVER > self.CurVer and password == self.TRUNKPASS) or SELVER <= self.CurVer:
+                    self._markReconfigureRoot('MythTV-Updates-Repo', version)
+                    self._markReconfigureRoot('MythTV-Updates-Activated', activated)
                     SENDLIST = True
-                elif self.mythtv_updates_checkbox.get_active() == False:
-                    self._markReconfigureRoot('MythTV-Updates-Activated', self.mythtv_updates_checkbox.get_active())
+                elif activated == False:
+                    self._markReconfigureRoot('MythTV-Updates-Activated', activated)
         if SENDLIST == True:
             self._markReconfigureRoot('Repo-list', self.versions)
-        if self.mcp_updates_checkbox.get_active() != self.MCPUpdatesActivated:
-            self._markReconfigureRoot('MCP-Updates-Activated', self.mcp_updates_checkbox.get_active())
+        if mcp != self.MCPUpdatesActivated:
+            self._markReconfigureRoot('MCP-Updates-Activated', mcp)
+        #repos are added without updating, the apply updates once for all
+        if SENDLIST == True or mcp != self.MCPUpdatesActivated:
+            self._markUpdatePackageList()
 
     def refresh_button_clicked(self, widget, data=None):
         """Download a new db file if requested"""
         self.downloadFile()
-        self.captureState()
-        self.applyStateToGUI()
+        self.refresh()
 
     def downloadFile(self):
         """Download files"""
@@ -209,13 +244,11 @@ class MythbuntuReposPlugin(MCPPlugin):
             url = self.DOWNLOADURL
         except:
             url = 'https://raw.githubusercontent.com/mythcp/mythbuntu-control-panel/master/repos.db'
+        #the network stack is only imported when a download runs
+        import urllib.request
+        from urllib.error import HTTPError,URLError
         try:
-            self.emit_progress("_", 0) #init (to do: remove)
-            time.sleep(0.1)
-            import urllib.request
-            from urllib.error import HTTPError,URLError
             self.emit_progress("Refreshing available repos from server", 20)
-            time.sleep(1)
             # Open the url
             f = urllib.request.urlopen(url)
             # Open our local file for writing
@@ -231,54 +264,51 @@ class MythbuntuReposPlugin(MCPPlugin):
         except URLError as e:
             print("URL Error:",e.reason , url)
             self.emit_progress("URL Error: Failed to download new DB file", 0)
-        time.sleep(2)
         self.emit_progress("_", 'done')
 
     #
     # Process selected activities
     #
 
+    def getScriptedResources(self,reconfigure):
+        """All repository changes edit the apt sources and the config file"""
+        return [(list(reconfigure), ['/etc/apt/sources.list.d', self.CONFIGFILE])]
+
     def root_scripted_changes(self, reconfigure):
         """System-wide changes that need root access to be applied.
            This function is ran by the dbus backend"""
         self.emit_progress("Opening config file", 10)
-        time.sleep(1)
         if os.path.exists(self.CONFIGFILE):
             self.config.read("/etc/default/mythbuntu-repos")
         else:
             self.config.add_section("cfg")
         if "Repo-list" in reconfigure:
             self.emit_progress("Removing old repositories", 40)
-            time.sleep(1)
             for item in reconfigure["Repo-list"]:
                 if item.endswith(".x"):
                     item = item.strip(".x")
-                    subprocess.call(["apt-add-repository", "-r", "-y", "ppa:mythbuntu/"+item])
+                    subprocess.call(["apt-add-repository", "-n", "-r", "-y", "ppa:mythbuntu/"+item])
         if "MythTV-Updates-Activated" in reconfigure:
             self.emit_progress("Configuring MythTV Updates repo", 60)
-            time.sleep(1)
             if reconfigure["MythTV-Updates-Activated"]:
                 repo = reconfigure["MythTV-Updates-Repo"]
                 self.config.set("cfg", "ActivateMythTVUpdates", "True")
                 self.config.set("cfg", "MythTVRepo", repo)
                 if repo.endswith(".x"):
                     repo = repo.strip(".x")
-                subprocess.call(["apt-add-repository", "-y", "ppa:mythbuntu/"+repo])
+                subprocess.call(["apt-add-repository", "-n", "-y", "ppa:mythbuntu/"+repo])
             else:
                 self.config.set("cfg", "ActivateMythTVUpdates", "False")
         #MCP Updates PPA:
         if "MCP-Updates-Activated" in reconfigure:
             self.emit_progress("Configuring MCP repo", 70)
-            time.sleep(1)
             if reconfigure["MCP-Updates-Activated"]:
-                subprocess.call(["apt-add-repository", "-y", "ppa:mythcp/mcp"])
+                subprocess.call(["apt-add-repository", "-n", "-y", "ppa:mythcp/mcp"])
                 self.config.set("cfg", "ActivateMCPUpdates", "True")
             else:
-                subprocess.call(["apt-add-repository", "-r", "-y", "ppa:mythcp/mcp"])
+                subprocess.call(["apt-add-repository", "-n", "-r", "-y", "ppa:mythcp/mcp"])
                 self.config.set("cfg", "ActivateMCPUpdates", "False")
         with open('/etc/default/mythbuntu-repos', 'w', encoding='utf8') as configfile:
             self.emit_progress("Writing config file", 80)
-            time.sleep(1)
             self.config.write(configfile)
         self.emit_progress("Done configuring repositories", 100)
-        time.sleep(2)
@@ -21,9 +21,12 @@
 
 from MythbuntuControlPanel.plugin import MCPPlugin
 from shlex import quote
-import os, string, re, grp, getpass, subprocess, shutil, time
+import os, string, re, getpass, subprocess, shutil
 import webbrowser
 
+#Methods of delaying the backend start, in the order of delaystartbox
+DELAY_METHODS = ('Basic', 'Ping', 'HDHomeRun')
+
 class SetupPlugin(MCPPlugin):
     """A plugin for misc system configuraton and launching backend setup"""
 
@@ -35,19 +38,18 @@ class SetupPlugin(MCPPlugin):
         information["ui"] = "tab_setup"
         MCPPlugin.__init__(self,information)
 
-    def captureState(self):
+    def getWatchedPaths(self):
+        """Returns the paths the captured state depends on"""
+        return ['/etc/systemd/system/mythtv-backend.service.d/override.conf',
+                '~/.mythtv/config.xml', '/etc/group']
+
+    def probeState(self):
         """Determines the state of the items managed by this plugin
            and stores it into the plugin's own internal structures"""
-        self.adduser_state=False #Current user is not in mythtv group unless found in group below
-        current_user = getpass.getuser()
-        groups = grp.getgrall()
-        for group in groups:
-            if group.gr_name == "mythtv" and current_user in group.gr_mem:
-                self.adduser_state=True #Current user is in mythtv group
-                break
-        self.linkconfig_state=os.path.exists(os.environ['HOME'] + '/.mythtv/config.xml')
-        self.be_state = subprocess.run(['systemctl', 'is-active', '--quiet', 'mythtv-backend']).returncode
-        if os.path.exists('/etc/systemd/system/mythtv-backend.service.d/override.conf'):
+        self.adduser_state=self.snapshot.user_in_group("mythtv", getpass.getuser())
+        self.linkconfig_state=self.snapshot.exists(os.environ['HOME'] + '/.mythtv/config.xml')
+        self.be_active = self.snapshot.unit_active('mythtv-backend')
+        if self.snapshot.exists('/etc/systemd/system/mythtv-backend.service.d/override.conf'):
             self.delaybackendstart_state=True
             conffile = open("/etc/systemd/system/mythtv-backend.service.d/override.conf", "r")
             self.delaymethod_state=0 #Basic
@@ -69,7 +71,7 @@ class SetupPlugin(MCPPlugin):
            for this plugin"""
         self.addusertomythgrp.set_active(self.adduser_state)
         self.addlinktoconfig.set_active(self.linkconfig_state)
-        if not self.be_state == 0:
+        if not self.be_active:
             self.mythtv_setup_button.set_sensitive(False)
         if self.delaybackendstart_state:
             self.enablenetworking.set_active(True)
@@ -81,9 +83,9 @@ class SetupPlugin(MCPPlugin):
         else:
             self.enablenetworking.set_active(False)
             self.pingentry.hide()
-        if not self.be_state == 0:
+        if not self.be_active:
             self.enablenetworking.set_sensitive(False)
-        if not self.be_state == 0 or not self.delaybackendstart_state:
+        if not self.be_active or not self.delaybackendstart_state:
             self.delaystartbox.set_sensitive(False)
             self.pingentry.set_sensitive(False)
 
@@ -107,37 +109,86 @@ class SetupPlugin(MCPPlugin):
 
     def compareState(self):
         """Determines what items have been modified on this plugin"""
+        self._compareChoices(self.addusertomythgrp.get_active(),
+                             self.addlinktoconfig.get_active(),
+                             self.enablenetworking.get_active(),
+                             self.delaystartbox.get_active(),
+                             self.pingentry.get_text())
+
+    def compareProfile(self,settings):
+        """Determines what items need to change to match a provisioning
+           profile.  Recognized keys are mythtv_group, link_config,
+           backend_network (no, Basic, Ping or HDHomeRun) and
+           ping_location"""
+        if self.delaybackendstart_state:
+            network = DELAY_METHODS[self.delaymethod_state]
+        else:
+            network = 'no'
+        network = settings.get('backend_network', network)
+        if network == 'no':
+            networking = False
+            method = self.delaymethod_state if self.delaybackendstart_state else 0
+        elif network in DELAY_METHODS:
+            networking = True
+            method = DELAY_METHODS.index(network)
+        else:
+            raise ValueError("backend_network must be no, " + ', '.join(DELAY_METHODS) + ", not " + network)
+        ping = settings.get('ping_location', getattr(self, 'pingentry_state', ''))
+        if networking and network == 'Ping' and ping == '':
+            raise ValueError("backend_network Ping needs a ping_location")
+        self._compareChoices(settings.getboolean('mythtv_group', self.adduser_state),
+                             settings.getboolean('link_config', self.linkconfig_state),
+                             networking, method, ping)
+
+    def _compareChoices(self,adduser,linkconfig,networking,method,ping):
+        """Marks the changes needed to go from the probed state to the
+           chosen one.  method is the index of the delay method in
+           DELAY_METHODS"""
         #Prepare for state capturing
         MCPPlugin.clearParentState(self)
-        adduserstate = self.addusertomythgrp.get_active()
-        if self.adduser_state != adduserstate:
+        if 0 <= method < len(DELAY_METHODS):
+            method_name = DELAY_METHODS[method]
+        else:
+            method_name = None
+        if self.adduser_state != adduser:
             current_user = quote(getpass.getuser())
-            if adduserstate:
+            if adduser:
                 self._markReconfigureRoot("user_in_mythtv_group",'adduser ' + current_user + ' mythtv')
             else:
                 self._markReconfigureRoot("user_in_mythtv_group",'deluser ' + current_user + ' mythtv')
-        if self.linkconfig_state != self.addlinktoconfig.get_active():
-            self._markReconfigureUser("link_config_file",self.addlinktoconfig.get_active())
-        if self.delaybackendstart_state != self.enablenetworking.get_active():
-            if self.enablenetworking.get_active():
+        if self.linkconfig_state != linkconfig:
+            self._markReconfigureUser("link_config_file",linkconfig)
+        if self.delaybackendstart_state != networking:
+            if networking:
                 self._markReconfigureRoot("modify_networking","enable")
-                self._markReconfigureRoot("backend_waits_for_network",self.delaystartbox.get_active_text())
-                if self.delaystartbox.get_active_text() == "Ping":
-                    self._markReconfigureRoot("ping_location",self.pingentry.get_text())
+                self._markReconfigureRoot("backend_waits_for_network",method_name)
+                if method_name == "Ping":
+                    self._markReconfigureRoot("ping_location",ping)
             else:
                 self._markReconfigureRoot("modify_networking","disable")
-        if self.delaybackendstart_state and self.enablenetworking.get_active(): # Networking was enabled and is still enabled
+        if self.delaybackendstart_state and networking: # Networking was enabled and is still enabled
             reconfig_delay_method = False
-            if self.delaymethod_state != self.delaystartbox.get_active(): # User selected different delay method
+            if self.delaymethod_state != method: # User selected different delay method
                 reconfig_delay_method = True
-            if self.delaymethod_state == 1 and self.delaystartbox.get_active() == 1: # The delay method was and still is Ping
-                if self.pingentry_state != self.pingentry.get_text(): # User entered different ping location
+            if self.delaymethod_state == 1 and method == 1: # The delay method was and still is Ping
+                if self.pingentry_state != ping: # User entered different ping location
                     reconfig_delay_method = True
             if reconfig_delay_method:
                 self._markReconfigureRoot("modify_networking","delaymethod")
-                self._markReconfigureRoot("backend_waits_for_network",self.delaystartbox.get_active_text())
-                if self.delaystartbox.get_active_text() == "Ping":
-                    self._markReconfigureRoot("ping_location",self.pingentry.get_text())
+                self._markReconfigureRoot("backend_waits_for_network",method_name)
+                if method_name == "Ping":
+                    self._markReconfigureRoot("ping_location",ping)
+
+    def getScriptedResources(self,reconfigure):
+        """Group membership is independent of the backend's network setup"""
+        return [(['user_in_mythtv_group'], ['/etc/group']),
+                (['modify_networking', 'backend_waits_for_network', 'ping_location'],
+                 ['mythtv-backend.service', '/etc/mysql/conf.d/mythtv.cnf'])]
+
+    def dependsOnPackages(self,reconfigure):
+        """Both units need the packages that create the group, service and
+           config file"""
+        return True
 
     def root_scripted_changes(self,reconfigure):
         """System-wide changes that need root access to be applied.
@@ -151,7 +202,6 @@ class SetupPlugin(MCPPlugin):
                     delaymethod = reconfigure["backend_waits_for_network"]
                     if delaymethod == "Basic":
                         self.emit_progress("Setting MythTV Backend to start after network is up", 10)
-                        time.sleep(2)
                         if os.path.exists('/etc/systemd/system/mythtv-backend.service.d/override.conf'):
                             subprocess.run(['systemctl', 'revert', 'mythtv-backend'])
                         if not os.path.exists('/etc/systemd/system/mythtv-backend.service.d'):
@@ -168,11 +218,9 @@ class SetupPlugin(MCPPlugin):
                     if delaymethod == "Ping":
                         pinginput = reconfigure["ping_location"]
                         self.emit_progress("Attempting to ping device at " + pinginput, 10)
-                        time.sleep(2)
                         pingable = subprocess.run(['/usr/share/mythbuntu/wait-until-pingable.py', pinginput, '15']).returncode
                         if pingable == 0:
                             self.emit_progress("Setting MythTV Backend to start after pinging device", 50)
-                            time.sleep(2)
                             if os.path.exists('/etc/systemd/system/mythtv-backend.service.d/override.conf'):
                                 subprocess.run(['systemctl', 'revert', 'mythtv-backend'])
                             if not os.path.exists('/etc/systemd/system/mythtv-backend.service.d'):
@@ -188,19 +236,14 @@ class SetupPlugin(MCPPlugin):
                                 edit_mysql_cnf = True
                         else:
                             self.emit_progress("Unable to ping device at provided location", 0)
-                            time.sleep(2)
                     if delaymethod == "HDHomeRun":
                         self.emit_progress("Attempting to discover HDHomeRun device", 10)
-                        time.sleep(2)
                         if not shutil.which("hdhomerun_config"):
                             self.emit_progress("hdhomerun_config is required but not currently installed", 0)
-                            time.sleep(2)
                         elif not subprocess.run(['hdhomerun_config', 'discover']).returncode == 0:
                             self.emit_progress("Unable to find HDHomeRun device", 0)
-                            time.sleep(2)
                         else:
                             self.emit_progress("Setting MythTV Backend to start after HDHomeRun is discoverable", 50)
-                            time.sleep(2)
                             if os.path.exists('/etc/systemd/system/mythtv-backend.service.d/override.conf'):
                                 subprocess.run(['systemctl', 'revert', 'mythtv-backend'])
                             if not os.path.exists('/etc/systemd/system/mythtv-backend.service.d'):
@@ -215,10 +258,8 @@ class SetupPlugin(MCPPlugin):
                                 edit_mysql_cnf = True
                     if reconfigure[item] == "delaymethod":
                         self.emit_progress("Done", 100)
-                        time.sleep(2)
                     if edit_mysql_cnf:
                         self.emit_progress("Enabling networking", 80)
-                        time.sleep(2)
                         if os.path.exists('/etc/mysql/conf.d/mythtv.cnf'):
                             cnf_file = open("/etc/mysql/conf.d/mythtv.cnf", "r")
                             new_cnf_file = ""
@@ -234,7 +275,6 @@ class SetupPlugin(MCPPlugin):
                             writing_file.write(new_cnf_file)
                             writing_file.close()
                             self.emit_progress("Done", 100)
-                            time.sleep(2)
                 if reconfigure[item] == "disable":
                     if os.path.exists('/etc/systemd/system/mythtv-backend.service.d/override.conf'):
                         subprocess.run(['systemctl', 'revert', 'mythtv-backend'])
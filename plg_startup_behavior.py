@@ -24,7 +24,7 @@
 from MythbuntuControlPanel.plugin import MCPPlugin
 import os
 import string
-import re, grp, getpass
+import re, getpass
 
 class LoginPlugin(MCPPlugin):
     """A plugin for startup options"""
@@ -38,20 +38,19 @@ class LoginPlugin(MCPPlugin):
         self.user_count=0
         MCPPlugin.__init__(self,information)
 
-    def captureState(self):
+    def getWatchedPaths(self):
+        """Returns the paths the captured state depends on"""
+        return ['~/.config/autostart', '/usr/share/applications/mythfrontend_d.desktop',
+                '/etc/group']
+
+    def probeState(self):
         """Determines the state of the items managed by this plugin
            and stores it into the plugin's own internal structures"""
         home = os.environ['HOME']
-        self.autostart_state=(os.path.exists(home + '/.config/autostart/mythtv.desktop') or 
-        os.path.exists(home + '/.config/autostart/mythfrontend_d.desktop'))
-        self.directstart_state=os.path.exists('/usr/share/applications/mythfrontend_d.desktop')
-        self.ingroup_state=False #Current user is not in mythtv group unless found in group below
-        current_user = getpass.getuser()
-        groups = grp.getgrall()
-        for group in groups:
-            if group.gr_name == "mythtv" and current_user in group.gr_mem:
-                self.ingroup_state=True #Current user is in mythtv group
-                break
+        self.autostart_state=(self.snapshot.exists(home + '/.config/autostart/mythtv.desktop') or 
+        self.snapshot.exists(home + '/.config/autostart/mythfrontend_d.desktop'))
+        self.directstart_state=self.snapshot.exists('/usr/share/applications/mythfrontend_d.desktop')
+        self.ingroup_state=self.snapshot.user_in_group("mythtv", getpass.getuser())
 
     def applyStateToGUI(self):
         """Takes the current state information and sets the GUI
@@ -64,13 +63,25 @@ class LoginPlugin(MCPPlugin):
 
     def compareState(self):
         """Determines what items have been modified on this plugin"""
+        self._compareChoices(self.enableautostartup.get_active(),
+                             self.enablestartdirect.get_active())
+
+    def compareProfile(self,settings):
+        """Determines what items need to change to match a provisioning
+           profile.  Recognized keys are autostart and directstart"""
+        self._compareChoices(settings.getboolean('autostart', self.autostart_state),
+                             settings.getboolean('directstart', self.directstart_state))
+
+    def _compareChoices(self,autostart,directstart):
+        """Marks the changes needed to go from the probed state to the
+           chosen one"""
         #Prepare for state capturing
         MCPPlugin.clearParentState(self)
-        if self.autostart_state != self.enableautostartup.get_active():
-            self._markReconfigureUser("autostartup",self.enableautostartup.get_active())
-        if self.directstart_state != self.enablestartdirect.get_active():
-            self._markReconfigureRoot("directstart",(self.enablestartdirect.get_active(),
-            self.enableautostartup.get_active(),os.environ['HOME']))
+        if self.autostart_state != autostart:
+            self._markReconfigureUser("autostartup",autostart)
+        if self.directstart_state != directstart:
+            self._markReconfigureRoot("directstart",(directstart,
+            autostart,os.environ['HOME']))
 
     def user_scripted_changes(self,reconfigure):
         """Local changes that can be performed by the user account.
@@ -102,6 +113,17 @@ class LoginPlugin(MCPPlugin):
                     if os.path.exists(home + '/.config/autostart/mythfrontend_d.desktop'):
                         os.remove(home + '/.config/autostart/mythfrontend_d.desktop')
 
+    def getScriptedResources(self,reconfigure):
+        """Direct start only touches its desktop file and autostart entries"""
+        autostart = '~/.config/autostart'
+        if 'directstart' in reconfigure:
+            autostart = reconfigure['directstart'][2] + '/.config/autostart'
+        return [(['directstart'], ['/usr/share/applications/mythfrontend_d.desktop', autostart])]
+
+    def dependsOnPackages(self,reconfigure):
+        """Direct start needs the frontend's desktop file to be installed"""
+        return True
+
     def root_scripted_changes(self,reconfigure):
         """System-wide changes that need root access to be applied.
            This function is ran by the dbus backend"""
@@ -23,7 +23,7 @@
 
 from MythbuntuControlPanel.plugin import MCPPlugin
 from MythbuntuControlPanel.dictionaries import *
-import shutil
+from MythbuntuControlPanel.packages import DPKG_STATUS
 
 class SystemRolesPlugin(MCPPlugin):
     """A tool for adjusting the role of a system"""
@@ -36,28 +36,32 @@ class SystemRolesPlugin(MCPPlugin):
         information["ui"] = "tab_system_roles"
         MCPPlugin.__init__(self,information)
 
-    def captureState(self):
+    def getWatchedPaths(self):
+        """Returns the paths the captured state depends on"""
+        return [DPKG_STATUS, '/usr/bin/tv_sort', '/usr/bin/hdhomerun_config',
+                '/usr/bin/hdhomerun_config_gui']
+
+    def probeState(self):
         """Determines the state of the items managed by this plugin
            and stores it in the plugin's own internal structures"""
         #We can't really represent no backend or no frontend well yet
         self.no_back=True
         self.no_front=True
 
-        #Dictionaries
+        #Dictionaries, keyed by package so no widgets are needed
         self.dictionary_state={}
-        roles = get_role_dictionary(self)
-        for item in roles:
-            self.dictionary_state[roles[item]]=self.query_installed(item)
-            if "backend" in item and self.dictionary_state[roles[item]]:
+        for item in dictionary_packages(get_role_dictionary):
+            self.dictionary_state[item]=self.query_installed(item)
+            if "backend" in item and self.dictionary_state[item]:
                 self.no_back=False
-            elif "frontend" in item and self.dictionary_state[roles[item]]:
+            elif "frontend" in item and self.dictionary_state[item]:
                 self.no_front=False  
 
         #corner case
-        if self.dictionary_state[self.primary_backend_radio]:
-            self.dictionary_state[self.secondary_backend_radio]=False
+        if self.dictionary_state['mythtv-backend-master']:
+            self.dictionary_state['mythtv-backend']=False
 
-        if shutil.which("tv_sort"):
+        if self.snapshot.which("tv_sort"):
             self.xmltv_installed_state=True
         else:
             self.xmltv_installed_state=False
@@ -65,24 +69,28 @@ class SystemRolesPlugin(MCPPlugin):
             self.sshs_installed_state=True
         else:
             self.sshs_installed_state=False
-        if not self.primary_backend_radio.get_active():
-            self.xmltv_guide_data.set_sensitive(False)
-        if shutil.which("hdhomerun_config"):
+        if self.snapshot.which("hdhomerun_config"):
             self.hdhomerun_c_installed_state=True
         else:
             self.hdhomerun_c_installed_state=False
-        if shutil.which("hdhomerun_config_gui"):
+        if self.snapshot.which("hdhomerun_config_gui"):
             self.hdhomerun_c_gui_installed_state=True
         else:
             self.hdhomerun_c_gui_installed_state=False
 
+    def captureState(self):
+        """Marks the widgets that depend on the probed state"""
+        if not self.primary_backend_radio.get_active():
+            self.xmltv_guide_data.set_sensitive(False)
+
     def applyStateToGUI(self):
         """Takes the current state information and sets the GUI
            for this plugin"""
         #Load the detected dictionary
+        roles = get_role_dictionary(self)
         for item in self.dictionary_state:
             if self.dictionary_state[item]:
-                item.set_active(True)
+                roles[item].set_active(True)
 
         #In case we don't have a front or back role
         self.no_backend_radio.set_active(self.no_back)
@@ -104,45 +112,77 @@ class SystemRolesPlugin(MCPPlugin):
 
     def compareState(self):
         """Determines what items have been modified on this plugin"""
+        self._compareChoices(self.primary_backend_radio.get_active(),
+                             self.secondary_backend_radio.get_active(),
+                             self.frontend_radio.get_active(),
+                             self.xmltv_guide_data.get_active(),
+                             self.enablessh.get_active(),
+                             self.hdhomerun_config.get_active(),
+                             self.hdhomerun_config_gui.get_active())
+
+    def compareProfile(self,settings):
+        """Determines what items need to change to match a provisioning
+           profile.  Recognized keys are backend (primary, secondary or
+           none), frontend, xmltv, ssh, hdhomerun_config and
+           hdhomerun_config_gui"""
+        backend = settings.get('backend', None)
+        if backend is None:
+            primary = self.dictionary_state['mythtv-backend-master']
+            secondary = self.dictionary_state['mythtv-backend']
+        elif backend in ('primary', 'secondary', 'none'):
+            primary = backend == 'primary'
+            secondary = backend == 'secondary'
+        else:
+            raise ValueError("backend must be primary, secondary or none, not " + backend)
+        self._compareChoices(primary, secondary,
+                             settings.getboolean('frontend', self.dictionary_state['mythtv-frontend']),
+                             settings.getboolean('xmltv', self.xmltv_installed_state),
+                             settings.getboolean('ssh', self.sshs_installed_state),
+                             settings.getboolean('hdhomerun_config', self.hdhomerun_c_installed_state),
+                             settings.getboolean('hdhomerun_config_gui', self.hdhomerun_c_gui_installed_state))
+
+    def _compareChoices(self,primary,secondary,frontend,xmltv,ssh,hdhomerun_config,hdhomerun_config_gui):
+        """Marks the changes needed to go from the probed state to the
+           chosen one"""
         #Prepare for state capturing
         MCPPlugin.clearParentState(self)
 
         #backend unfortunately totally a corner case
-        if self.primary_backend_radio.get_active() != self.dictionary_state[self.primary_backend_radio]:
-            if self.primary_backend_radio.get_active():
+        if primary != self.dictionary_state['mythtv-backend-master']:
+            if primary:
                 self._markInstall('mythtv-backend-master')
             else:
                 self._markRemove('mythtv-backend-master')
-                if not self.secondary_backend_radio.get_active():
+                if not secondary:
                     self._markRemove('mythtv-backend')
-        elif self.secondary_backend_radio.get_active() != self.dictionary_state[self.secondary_backend_radio]:
-            if self.secondary_backend_radio.get_active():
+        elif secondary != self.dictionary_state['mythtv-backend']:
+            if secondary:
                 self._markInstall('mythtv-backend')
             else:
                 self._markRemove('mythtv-backend')
-        if self.frontend_radio.get_active() != self.dictionary_state[self.frontend_radio]:
-            if self.frontend_radio.get_active():
+        if frontend != self.dictionary_state['mythtv-frontend']:
+            if frontend:
                 self._markInstall('mythtv-frontend')
             else:
                 self._markRemove('mythtv-frontend')
-        if self.xmltv_guide_data.get_active() != self.xmltv_installed_state:
-            if self.xmltv_guide_data.get_active():
+        if xmltv != self.xmltv_installed_state:
+            if xmltv:
                 self._markInstall('xmltv')
             else:
                 self._markRemove('xmltv')
                 self._markRemove('xmltv-util')
-        if self.enablessh.get_active() != self.sshs_installed_state:
-            if self.enablessh.get_active():
+        if ssh != self.sshs_installed_state:
+            if ssh:
                 self._markInstall('openssh-server')
             else:
                 self._markRemove('openssh-server')
-        if self.hdhomerun_config.get_active() != self.hdhomerun_c_installed_state:
-            if self.hdhomerun_config.get_active():
+        if hdhomerun_config != self.hdhomerun_c_installed_state:
+            if hdhomerun_config:
                 self._markInstall('hdhomerun-config')
             else:
                 self._markRemove('hdhomerun-config')
-        if self.hdhomerun_config_gui.get_active() != self.hdhomerun_c_gui_installed_state:
-            if self.hdhomerun_config_gui.get_active():
+        if hdhomerun_config_gui != self.hdhomerun_c_gui_installed_state:
+            if hdhomerun_config_gui:
                 self._markInstall('hdhomerun-config-gui')
             else:
                 self._markRemove('hdhomerun-config-gui')
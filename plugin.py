@@ -26,19 +26,43 @@ import sys
 import os
 import string
 import traceback
+import importlib
+import ast
 import gi
 
 #GUI Support
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk
 
+from MythbuntuControlPanel.snapshot import SystemSnapshot
+from MythbuntuControlPanel.timing import PhaseTimer
+
 #Translation Support
 from gettext import gettext as _
 
+#Widget signals that mean the user changed something on a plugin page
+TRACKED_SIGNALS = ('toggled', 'changed')
+
+#Resources of scripted changes that have to wait for the package changes of
+#an apply, because they are changed by them or depend on what they install
+PACKAGE_RESOURCES = ('/var/lib/dpkg', '/etc/apt/sources.list.d')
+#Resources of root changes that edit the apt sources, ran before packages
+SOURCE_RESOURCES = ('/etc/apt/sources.list', '/etc/apt/sources.list.d')
+
 class MCPPluginLoader():
     """A class used for initializing all loadable plugins"""
-    def __init__(self,plugin_root_path):
+    def __init__(self,plugin_root_path,timer=None,modules=None):
+        """modules limits loading to the plugin modules named in it,
+           None loads all of them"""
         self._instances = {}
+        if timer is None:
+            timer = PhaseTimer(enabled=False)
+        self.timer = timer
+        self.modules = modules
+        #plugin file path -> (module name, mtime, size) of the last import
+        self._index = {}
+        #plugin file path -> (mtime, size, plugin name) read without importing
+        self._manifest = {}
 
         self.plugin_root_path = plugin_root_path
         self.plugin_path = plugin_root_path + '/python'
@@ -46,28 +70,138 @@ class MCPPluginLoader():
         if self.plugin_path not in sys.path:
             sys.path.insert(0, self.plugin_path)
 
-    def reload_plugins(self):
-        """Searches the path for all plugins asked for"""
-        plugins=[]
+    def _stat_plugin(self,path):
+        """Returns the (mtime, size) signature used to detect changed plugins"""
+        try:
+            info = os.stat(path)
+        except OSError:
+            return None
+        return (info.st_mtime_ns, info.st_size)
+
+    def _forget_module(self,module):
+        """Drops cached instances of classes that came from module"""
+        for plugin in list(self._instances):
+            if plugin.__module__ == module:
+                del self._instances[plugin]
+
+    def _plugin_files(self):
+        """Returns a dictionary of plugin file path -> module name"""
+        plugins={}
         for obj in os.listdir(self.plugin_path):
             if '.py' in obj and '.pyc' not in obj:
-                plugins.append(obj.split('.py')[0])
+                plugins[os.path.join(self.plugin_path, obj)] = obj.split('.py')[0]
+        return plugins
 
-        for plugin in plugins:
-            logging.debug(_("Importing plugin") + ": \t" + plugin)
+    def _read_plugin_name(self,path):
+        """Finds the name a plugin gives itself in its __init__, such as
+           information["name"] = "Remotes", by parsing rather than
+           importing it.  Returns None if there isn't a literal name"""
+        try:
+            with open(path, encoding='utf-8') as source:
+                tree = ast.parse(source.read(), path)
+        except (OSError, SyntaxError, ValueError):
+            return None
+        for node in ast.walk(tree):
+            if not isinstance(node, ast.Assign) or len(node.targets) != 1:
+                continue
+            target = node.targets[0]
+            if not isinstance(target, ast.Subscript) or \
+               not isinstance(target.value, ast.Name) or target.value.id != 'information':
+                continue
+            key = target.slice
+            #python < 3.9 wraps the subscript in an ast.Index
+            if type(key).__name__ == 'Index':
+                key = key.value
+            if isinstance(key, ast.Constant) and key.value == 'name' and \
+               isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+                return node.value.value
+        return None
+
+    def plugin_manifest(self):
+        """Returns a dictionary of plugin name -> module name for all
+           plugins on disk without importing any of them.  Names are
+           remembered until the plugin file changes"""
+        manifest = {}
+        plugins = self._plugin_files()
+        for path in list(self._manifest):
+            if path not in plugins:
+                del self._manifest[path]
+        for path, module in plugins.items():
+            signature = self._stat_plugin(path)
+            if signature is None:
+                continue
+            known = self._manifest.get(path)
+            if known is None or known[:2] != signature:
+                known = signature + (self._read_plugin_name(path),)
+                self._manifest[path] = known
+            if known[2] is not None:
+                manifest[known[2]] = module
+        return manifest
+
+    def find_plugin_module(self,name):
+        """Returns the module of the plugin named name, or None"""
+        return self.plugin_manifest().get(name)
+
+    def reload_plugins(self):
+        """Searches the path for all plugins asked for.  Plugins that have
+           not changed on disk since the last call are skipped, changed ones
+           are reloaded and new ones are imported."""
+        plugins = self._plugin_files()
+        if self.modules is not None:
+            for path in list(plugins):
+                if plugins[path] not in self.modules:
+                    del plugins[path]
+
+        #plugins that went away since the last scan
+        for path in list(self._index):
+            if path not in plugins:
+                module = self._index[path][0]
+                self._forget_module(module)
+                sys.modules.pop(module, None)
+                del self._index[path]
+
+        for path, plugin in plugins.items():
+            signature = self._stat_plugin(path)
+            if signature is None:
+                continue
+            indexed = self._index.get(path)
+            if indexed is not None and indexed[1:] == signature and plugin in sys.modules:
+                continue
             try:
-                __import__(plugin, None, None, [''])
+                with self.timer.phase("import " + plugin):
+                    if plugin in sys.modules:
+                        logging.debug(_("Reloading plugin") + ": \t" + plugin)
+                        self._forget_module(plugin)
+                        importlib.reload(sys.modules[plugin])
+                    else:
+                        logging.debug(_("Importing plugin") + ": \t" + plugin)
+                        __import__(plugin, None, None, [''])
             except:
                 logging.warning( _("Error importing plugin ") + plugin)
                 traceback.print_exc()
+                self._index.pop(path, None)
                 continue
+            self._index[path] = (plugin,) + signature
 
     def find_plugin_classes(self):
-        """Returns currently loaded plugin class types"""
+        """Returns currently loaded plugin class types.  Only classes of
+           modules this loader imported from files still on disk count"""
+        result = []
+        indexed = set(entry[0] for entry in self._index.values())
+        for plugin in MCPPlugin.__subclasses__():
+            if plugin.__module__ not in indexed:
+                continue
+            #skip stale classes left behind by a module reload
+            module = sys.modules.get(plugin.__module__)
+            if getattr(module, plugin.__name__, None) is not plugin:
+                continue
+            if self.modules is not None and plugin.__module__ not in self.modules:
+                continue
+            result.append(plugin)
         logging.debug(_("Found the following plugin classes:"))
-        logging.debug(MCPPlugin.__subclasses__())
+        logging.debug(result)
 
-        return MCPPlugin.__subclasses__()
+        return result
 
     def find_plugin_instances(self):
         """Returns all current instances of plugins"""
@@ -88,6 +222,65 @@ class MCPPluginLoader():
 
         return result
 
+class ChangeSet():
+    """All changes requested by the plugins for a single apply.  Packages
+       are kept in insertion ordered sets mapped to the set of modules that
+       asked for them, reconfigure items are keyed by module.  Merging a plugin
+       costs one lookup per item and records packages that one plugin
+       wants installed while another wants them removed."""
+
+    def __init__(self):
+        self.install = {}
+        self.remove = {}
+        self.reconfigure_root = {}
+        self.reconfigure_user = {}
+        self.request_update = False
+        self.request_unauth = False
+        #(package, installing module, removing module)
+        self.conflicts = []
+
+    def merge(self,plugin):
+        """Adds the raw changes of a plugin"""
+        module = plugin.getInformation("module")
+        (install,remove,root,user,update,unauth) = plugin.getRawChanges()
+        for package in install:
+            for remover in self.remove.get(package, ()):
+                self.conflicts.append((package, module, remover))
+            self.install.setdefault(package, set()).add(module)
+        for package in remove:
+            for installer in self.install.get(package, ()):
+                self.conflicts.append((package, installer, module))
+            self.remove.setdefault(package, set()).add(module)
+        if len(root) > 0:
+            self.reconfigure_root[module] = dict(root)
+        if len(user) > 0:
+            self.reconfigure_user[module] = dict(user)
+        if update:
+            self.request_update = True
+        if unauth:
+            self.request_unauth = True
+
+    def packageModules(self):
+        """Returns the modules that asked for any package change"""
+        modules = set()
+        for requesters in self.install.values():
+            modules |= requesters
+        for requesters in self.remove.values():
+            modules |= requesters
+        return modules
+
+    def hasConflicts(self):
+        """Returns whether any package is both installed and removed"""
+        return len(self.conflicts) > 0
+
+    def isEmpty(self):
+        """Returns whether there is nothing to do"""
+        return len(self.install)          == 0 and \
+               len(self.remove)           == 0 and \
+               len(self.reconfigure_root) == 0 and \
+               len(self.reconfigure_user) == 0 and \
+               not self.request_update
+
 class MCPPlugin(object):
     """An abstract class that defines what all plugins need to be able to do"""
 
@@ -105,6 +298,13 @@ class MCPPlugin(object):
             self._abstract("__init__: information keys")
         self._information = information
         self._incomplete = False
+        self.snapshot = SystemSnapshot()
+        self.pkg_index = None
+        self._queries_packages = False
+        self._cached_widget_state = None
+        self._stale_state = False
+        self._handlers_connected = False
+        self.clearDirty()
         self.clearParentState()
 
     ###Helper functions###
@@ -113,7 +313,9 @@ class MCPPlugin(object):
         self.plugin_root_path = plugin_root_path
 
     def _mark_array(self,array,item,value,action):
-        """Internal helper function for modifying arrays"""
+        """Internal helper function for modifying arrays.  Package marks
+           are dictionaries used as ordered sets, so marking an item twice
+           keeps a single entry"""
         if action:
             if type(array) is dict:
                 array[item]=value
@@ -121,7 +323,7 @@ class MCPPlugin(object):
                 array.append(item)
         else:
             if type(array) is dict:
-                array.pop(item)
+                array.pop(item, None)
             else:
                 for tmp in array:
                     if tmp == item:
@@ -135,9 +337,20 @@ class MCPPlugin(object):
                                   (self.__class__.__module__,
                                    self.__class__.__name__, method))
 
-    def updateCache(self,cache):
-        """Updates the apt package cache"""
+    def updateCache(self,cache,changed=True):
+        """Updates the apt package cache.  changed is False when the
+           cache is the same one handed over by the previous refresh"""
         self.pkg_cache=cache
+        self.pkg_cache_changed=changed
+
+    def updateInstalledIndex(self,index):
+        """Updates the dpkg status index used to answer query_installed
+           without the apt cache"""
+        self.pkg_index=index
+
+    def updateSnapshot(self,snapshot):
+        """Updates the shared snapshot of system probes"""
+        self.snapshot=snapshot
 
     def getInformation(self,key=None):
         """Returns a standard information key"""
@@ -150,6 +363,9 @@ class MCPPlugin(object):
 
     def query_installed(self,package):
         """Determines if a single package is installed"""
+        self._queries_packages = True
+        if self.pkg_index is not None:
+            return self.pkg_index.is_installed(package)
         try:
             result = self.pkg_cache[package].current_ver
             if result == None:
@@ -159,6 +375,11 @@ class MCPPlugin(object):
         except KeyError:
             return False
 
+    def queriesPackages(self):
+        """Returns whether the plugin has looked at package state, which
+           decides if refreshing it alone needs a fresh package cache"""
+        return self._queries_packages
+
     def getIncomplete(self):
         """Returns whether a plugin has been fully filled out"""
         return self._incomplete
@@ -185,11 +406,14 @@ class MCPPlugin(object):
             logging.debug("Reading UI file: %s" % ui_file)
             self.builder.add_from_file(ui_file)
 
-    def insert_subpage(self,notebook,buttonbox,handler):
+    def insert_subpage(self,notebook,buttonbox,handler,lazy=False):
         """Inserts a subtab into the notebook.  This assumes the file
         shares the same base name as the page you are looking for.
         Returns tuple: (name,tab) where tab is the numeric index of the
-        tab in the GtkNoteBook"""
+        tab in the GtkNoteBook
+
+        If lazy is set, only the button is created and an empty page
+        holds the tab's place until build_subpage is called."""
 
         # Button for the notebook widget
         label=Gtk.Label(label=self._information["name"])
@@ -204,12 +428,28 @@ class MCPPlugin(object):
         hbox.pack_start(label,False,False,0)
         button.add(hbox)
         buttonbox.add(button)
+        self._button = button
         button.connect("clicked",handler)
         label.show()
         icon.show()
         hbox.show()
         button.show()
 
+        self._notebook = notebook
+        self._built = False
+        if lazy:
+            #placeholder that gets swapped out for the real page later
+            self._page = Gtk.Box()
+            self._page.show()
+            notebook.append_page(self._page,None)
+        else:
+            self.build_subpage()
+        return (self._information["name"],notebook.page_num(self._page))
+
+    def build_subpage(self):
+        """Loads the plugin's UI file and puts its page in the notebook,
+        replacing the placeholder left by a lazy insert_subpage"""
+
         # See http://faq.pyGtk.org/index.py?req=show&file=faq22.002.htp
         # for internationalisation support
         widget = None
@@ -217,39 +457,198 @@ class MCPPlugin(object):
         ui_file = os.path.join(self.plugin_root_path,'ui',self._information["ui"] + ".ui")
         logging.debug("Reading .ui file: %s" % ui_file)
         self.builder.add_from_file(ui_file)
-        self.builder.connect_signals(self)
+        self._handlers_connected = False
+        #cached values go in before any handler is connected, and the
+        #handlers wait for the probe so they never run on cached state
+        if self._cached_widget_state:
+            self.setWidgetState(self._cached_widget_state)
+            self._stale_state = True
+        else:
+            self.connectHandlers()
         for widget in self.builder.get_objects():
             if not isinstance(widget, Gtk.Widget):
                 continue
             widget.set_name(Gtk.Buildable.get_name(widget))
             setattr(self, widget.get_name(), widget)
+            for signal in TRACKED_SIGNALS:
+                try:
+                    widget.connect(signal, self._on_widget_changed)
+                except TypeError:
+                    #widget doesn't have this signal
+                    pass
         #widget that we will append in the notebook
         widget = self.builder.get_object(self._information["ui"])
 
         logging.debug("Appending Widget: %s" % widget.get_name())
-        notebook.append_page(widget,None)
-        return (self._information["name"],notebook.page_num(widget))
+        placeholder = getattr(self, '_page', None)
+        if placeholder is not None and placeholder.get_parent() is self._notebook:
+            page = self._notebook.page_num(placeholder)
+            self._notebook.remove_page(page)
+            self._notebook.insert_page(widget,None,page)
+        else:
+            self._notebook.append_page(widget,None)
+        self._page = widget
+        self._built = True
+
+    def connectHandlers(self):
+        """Connects the signal handlers of the page to the plugin, unless
+           that was done already"""
+        if not self._handlers_connected:
+            self.builder.connect_signals(self)
+            self._handlers_connected = True
+
+    def isBuilt(self):
+        """Returns whether the plugin's UI has been loaded"""
+        return getattr(self, '_built', False)
+
+    ###Change tracking###
+    def _on_widget_changed(self,widget,*args):
+        """Signal handler that records which widgets the user touched"""
+        self.markDirty(widget.get_name())
+
+    def markDirty(self,widget_name=None):
+        """Marks the plugin as needing compareState before the next apply.
+           Plugins with widgets that don't emit toggled or changed
+           should call this from their own handlers"""
+        self._dirty = True
+        if widget_name is not None:
+            self._dirty_widgets.add(widget_name)
+
+    def clearDirty(self):
+        """Marks the GUI as matching the last compared state"""
+        self._dirty = False
+        self._dirty_widgets = set()
+
+    def isDirty(self):
+        """Returns whether the GUI may have changed since the last compare"""
+        return self._dirty
+
+    def getDirtyWidgets(self):
+        """Returns the names of the widgets changed since the last compare"""
+        return set(self._dirty_widgets)
+
+    ###Cached widget state###
+    def getWidgetState(self,names=None):
+        """Returns a dictionary of widget name -> [value, sensitive] for
+           the toggle buttons, combo boxes and entries of the page, or
+           only the ones in names.  Text combo boxes also get their
+           entries, as plugins usually fill them in captureState.
+           Password entries are left out"""
+        state = {}
+        for widget in self.builder.get_objects():
+            if not isinstance(widget, Gtk.Widget):
+                continue
+            name = widget.get_name()
+            if names is not None and name not in names:
+                continue
+            if isinstance(widget, Gtk.ToggleButton) or isinstance(widget, Gtk.ComboBox):
+                value = widget.get_active()
+            elif isinstance(widget, Gtk.Entry) and widget.get_visibility():
+                value = widget.get_text()
+            else:
+                continue
+            state[name] = [value, widget.get_sensitive()]
+            if isinstance(widget, Gtk.ComboBoxText):
+                state[name].append([row[0] for row in widget.get_model()])
+        return state
+
+    def setWidgetState(self,state):
+        """Sets widgets to the values returned by getWidgetState"""
+        for name in state:
+            widget = self.builder.get_object(name)
+            if widget is None:
+                continue
+            (value, sensitive) = state[name][:2]
+            if isinstance(widget, Gtk.ComboBox) and len(widget.get_model()) == 0:
+                #entries filled at capture time go in before the index
+                if isinstance(widget, Gtk.ComboBoxText) and len(state[name]) > 2:
+                    for entry in state[name][2]:
+                        widget.append_text(entry)
+                else:
+                    logging.debug("Skipping empty combo box %s" % name)
+                    continue
+            if isinstance(widget, Gtk.RadioButton) and not value:
+                #leaving a group is done by activating another member
+                pass
+            elif isinstance(widget, Gtk.ToggleButton) or isinstance(widget, Gtk.ComboBox):
+                widget.set_active(value)
+            elif isinstance(widget, Gtk.Entry):
+                widget.set_text(value)
+            widget.set_sensitive(sensitive)
+
+    def useCachedWidgetState(self,state):
+        """Remembers widget values from a previous run.  They are shown
+           as soon as the page is built and stay stale until the next
+           captureState"""
+        self._cached_widget_state = state
+
+    def getCachedWidgetState(self):
+        """Returns the widget values shown before the first capture"""
+        return self._cached_widget_state
+
+    def hasStaleState(self):
+        """Returns whether the page still shows cached widget values"""
+        return self._stale_state
+
+    def clearStaleState(self):
+        """Marks the page as showing the captured state"""
+        self._stale_state = False
+        self._cached_widget_state = None
 
     ###State machine of the plugin###
     def clearParentState(self):
         """Clears the state of the elements that were stored for between
            runs"""
-        self._to_install     = []
-        self._to_remove      = []
+        self._to_install     = {}
+        self._to_remove      = {}
         self._to_reconfigure_root = {}
         self._to_reconfigure_user = {}
         self._request_update = False
         self._request_unauth = False
 
+    def refresh(self):
+        """Captures the state of this plugin alone again, for handlers
+           that know something changed, such as after a download.  The
+           frontend replaces this with its own per plugin refresh, which
+           also keeps other plugins and the apt cache untouched"""
+        self.probeState()
+        self.captureState()
+        self.applyStateToGUI()
+
+    def getWatchedPaths(self):
+        """Returns the paths the captured state depends on, so the plugin
+           can be captured again when something outside MCP changes them.
+           Directories, files and glob patterns are all allowed, and so
+           are ~ and environment variables"""
+        return []
+
+    def probeState(self):
+        """Probes the system for the state of the items managed by this
+           plugin without touching any widgets.  This may be ran on a
+           worker thread, and is always followed by captureState on the
+           main thread"""
+        pass
+
     def captureState(self):
         """Determines the state of the items on managed by this plugin
-           and stores it into the plugin's own internal structures"""
-        self._abstract("captureState")
+           and stores it into the plugin's own internal structures.
+           Plugins that do all of their work in probeState don't need to
+           override this"""
+        if type(self).probeState is MCPPlugin.probeState:
+            self._abstract("captureState")
 
     def compareState(self):
         """Determines what items have been modified on this plugin"""
         self._abstract("compareState")
 
+    def compareProfile(self,settings):
+        """Determines what items need to change for the system to match
+           a provisioning profile, without any widgets.  settings is the
+           plugin's section of the profile and is always preceded by
+           probeState.  Plugins that can't be provisioned don't need to
+           override this"""
+        self._abstract("compareProfile")
+
     def applyStateToGUI(self):
         """Takes the current state information and sets the GUI
            for this plugin"""
@@ -282,7 +681,7 @@ class MCPPlugin(object):
 
     def getRawChanges(self):
         """Returns a tupple of raw arrays that can be assembled together"""
-        return (self._to_install,self._to_remove,self._to_reconfigure_root, self._to_reconfigure_user,self._request_update,self._request_unauth)
+        return (list(self._to_install),list(self._to_remove),self._to_reconfigure_root, self._to_reconfigure_user,self._request_update,self._request_unauth)
 
     def summarizeChanges(self):
         """Returns a pretty summary of all management activities that will occur"""
@@ -315,6 +714,45 @@ class MCPPlugin(object):
            This function is ran by the dbus backend"""
         self._abstract("root_scripted_changes")
 
+    def getScriptedResources(self,reconfigure):
+        """Splits the items of reconfigure into units for the backend.
+           Returns a list of tuples (items, resources) where items is a
+           list of keys of reconfigure handed to a single
+           root_scripted_changes call, and resources names what those
+           items touch, such as files, directories or systemd units.
+           Units of any plugin that share no resources may run at the same
+           time.  Only list what the changes touch, changes that merely need
+           packages another plugin may install override dependsOnPackages
+           instead.  None for resources means the unit may touch anything,
+           which is the default"""
+        return [(list(reconfigure), None)]
+
+    def dependsOnPackages(self,reconfigure):
+        """Returns whether the root changes in reconfigure have to wait for
+           the package changes of the same apply.  Only changes that are
+           all in units declaring no PACKAGE_RESOURCES can run alongside
+           the package transaction.  Plugins whose changes need packages
+           without touching them override this rather than listing
+           PACKAGE_RESOURCES, which would serialize their units in the
+           backend"""
+        covered = set()
+        for (items, resources) in self.getScriptedResources(reconfigure):
+            if resources is None or any(resource in PACKAGE_RESOURCES for resource in resources):
+                return True
+            covered.update(items)
+        return any(item not in covered for item in reconfigure)
+
+    def changesSources(self,reconfigure):
+        """Returns whether the root changes in reconfigure edit the apt
+           sources, which are then applied before the package list update
+           and the package transaction.  All units of reconfigure have to
+           declare SOURCE_RESOURCES"""
+        units = self.getScriptedResources(reconfigure)
+        return len(units) > 0 and \
+               all(resources is not None and
+                   any(resource in SOURCE_RESOURCES for resource in resources)
+                   for (items, resources) in units)
+
     def user_scripted_changes(self,reconfigure):
         """Local changes that can be performed by the user account.
            This function will be ran by the frontend."""
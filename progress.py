@@ -0,0 +1,128 @@
+## -*- coding: utf-8 -*-
+#
+# «progress» - Progress messages without blocking the code that sends them
+#
+# Copyright (C) 2020, Ted (MythTV forums member heyted)
+#
+# MCP is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 3 of the License, or at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this application; if not, write to the Free Software Foundation, Inc., 51
+# Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##################################################################################
+
+import threading
+import time
+
+from gi.repository import GLib
+
+#Shortest time between two progress signals sent by the backend
+COALESCE_MS = 100
+#Shortest time a progress message stays on screen
+MIN_VISIBLE_MS = 1000
+
+class CoalescedProgress():
+    """Passes progress to emit from the main loop at most once every
+       interval ms.  It may be called from any thread and never blocks,
+       updates that come in faster than that replace each other so only
+       the latest one is sent"""
+
+    def __init__(self,emit,interval=COALESCE_MS):
+        self._emit = emit
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._pending = None
+        self._scheduled = False
+        self._last = 0
+
+    def __call__(self,progress,percent):
+        with self._lock:
+            self._pending = (progress, percent)
+            if self._scheduled:
+                return True
+            self._scheduled = True
+            wait = self._last + self._interval / 1000.0 - time.monotonic()
+        if wait > 0:
+            GLib.timeout_add(int(wait * 1000) + 1, self._send)
+        else:
+            GLib.idle_add(self._send)
+        return True
+
+    def flush(self):
+        """Sends the latest update from the main loop without waiting for
+           the interval, ahead of anything queued after it"""
+        GLib.idle_add(self._send)
+
+    def _send(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = None
+            self._scheduled = False
+            if pending is not None:
+                self._last = time.monotonic()
+        if pending is not None:
+            self._emit(*pending)
+        return False
+
+class ProgressDisplay():
+    """Hands progress updates to show, keeping each message on screen for
+       at least minimum ms with a main loop timer instead of making the
+       sender wait.  Messages that come in meanwhile replace each other and
+       the latest one is shown once the time is up.  Percentages of the
+       message on screen are shown right away.  A percent of 'done' hides
+       the progress once the last message had its time"""
+
+    def __init__(self,show,minimum=MIN_VISIBLE_MS):
+        self._show = show
+        self._minimum = minimum
+        self._text = None
+        self._shown_at = 0
+        self._pending = None
+        self._timeout = None
+
+    def update(self,text,percent):
+        if self._pending is None and percent != 'done' and \
+           (text is None or text == self._text):
+            self._show(text, percent)
+            return
+        if text is None and self._pending is not None:
+            #a new percentage for a message that is still queued
+            text = self._pending[0]
+        self._pending = (text, percent)
+        if self._timeout is not None:
+            return
+        wait = self._shown_at + self._minimum / 1000.0 - time.monotonic()
+        if wait > 0:
+            self._timeout = GLib.timeout_add(int(wait * 1000) + 1, self._flush)
+        else:
+            self._flush()
+
+    def reset(self):
+        """Forgets queued messages, for when the progress was hidden"""
+        if self._timeout is not None:
+            GLib.source_remove(self._timeout)
+            self._timeout = None
+        self._pending = None
+        self._text = None
+        self._shown_at = 0
+
+    def _flush(self):
+        self._timeout = None
+        (text, percent) = self._pending
+        self._pending = None
+        if percent == 'done':
+            self._text = None
+            self._shown_at = 0
+        elif text is not None:
+            self._text = text
+            self._shown_at = time.monotonic()
+        self._show(text, percent)
+        return False
@@ -0,0 +1,280 @@
+## -*- coding: utf-8 -*-
+#
+# «provision» - Unattended apply of a declarative MCP profile
+#
+# Copyright (C) 2020, Ted (MythTV forums member heyted)
+#
+# MCP is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 3 of the License, or at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this application; if not, write to the Free Software Foundation, Inc., 51
+# Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##################################################################################
+
+import logging
+import os
+import configparser
+import traceback
+
+from gi.repository import GLib
+
+from MythbuntuControlPanel.plugin import MCPPluginLoader, ChangeSet
+from MythbuntuControlPanel.snapshot import SystemSnapshot
+from MythbuntuControlPanel.packages import PackageCache, DpkgStatusIndex
+from MythbuntuControlPanel.planner import TransactionPlan
+
+#Translation Support
+from gettext import gettext as _
+
+#Seconds an aptdaemon transaction may take before it is cancelled
+TRANSACTION_TIMEOUT = 3 * 60 * 60
+
+class ProvisionError(Exception):
+    pass
+
+class Provisioner():
+    """Applies a provisioning profile without the GUI.  The profile is an
+       ini file with a section per plugin name, for example:
+
+         [System Roles]
+         backend = primary
+         frontend = yes
+
+       Plugins are loaded without building any widgets, each one with a
+       section compares the probed system against it in compareProfile,
+       and the changes go through the same aptdaemon and scriptedchanges
+       paths as an apply from the GUI."""
+
+    def __init__(self,plugin_root_path,profile_file):
+        if os.path.exists(plugin_root_path + '/python') and \
+                     os.path.exists(plugin_root_path + '/ui'):
+            self.plugin_root_path = plugin_root_path
+        else:
+            self.plugin_root_path = '/usr/share/mythbuntu/plugins'
+        self.profile = configparser.ConfigParser()
+        try:
+            with open(profile_file) as profile:
+                self.profile.read_file(profile)
+        except (OSError, configparser.Error) as e:
+            raise ProvisionError(_("Unable to read profile ") + profile_file + ": " + str(e))
+        self.loader = MCPPluginLoader(self.plugin_root_path)
+        self.plugins = []
+        self.ac = None
+        self._client = None
+
+    def load_plugins(self):
+        """Loads the plugins named in the profile"""
+        manifest = self.loader.plugin_manifest()
+        self.loader.modules = [manifest[name] for name in self.profile.sections() if name in manifest]
+        self.loader.reload_plugins()
+        cache = PackageCache().lazy()
+        index = DpkgStatusIndex()
+        index.load()
+        snapshot = SystemSnapshot()
+        found = {}
+        for plugin in self.loader.find_plugin_instances():
+            name = plugin.getInformation("name")
+            if not self.profile.has_section(name):
+                continue
+            plugin.updateCache(cache)
+            plugin.updateInstalledIndex(index)
+            plugin.updateSnapshot(snapshot)
+            plugin.emit_progress = self.report_progress
+            found[name] = plugin
+        for name in self.profile.sections():
+            if name not in found:
+                raise ProvisionError(_("No plugin is named ") + name)
+            self.plugins.append(found[name])
+
+    def plan(self):
+        """Returns a tuple (changes, summary) of the ChangeSet needed to
+           match the profile and a text summary of it"""
+        changes = ChangeSet()
+        summary = ''
+        for plugin in self.plugins:
+            name = plugin.getInformation("name")
+            try:
+                plugin.probeState()
+                plugin.compareProfile(self.profile[name])
+            except ValueError as e:
+                raise ProvisionError(name + ": " + str(e))
+            except NotImplementedError:
+                raise ProvisionError(name + _(" can't be provisioned"))
+            if plugin.getIncomplete():
+                raise ProvisionError(_("The ") + name + _(" settings are incomplete"))
+            text = plugin.summarizeChanges()
+            if text:
+                summary += name + ':\n- ' + text + '\n'
+                changes.merge(plugin)
+        if changes.hasConflicts():
+            conflicts = ''
+            for (package, installer, remover) in changes.conflicts:
+                conflicts += package + _(" is installed by ") + installer + _(" and removed by ") + remover + '\n'
+            raise ProvisionError(_("Some plugins requested contradicting package changes.") + '\n' + conflicts)
+        return (changes, summary)
+
+    def apply(self,changes):
+        """Applies a ChangeSet in the same order as the GUI does"""
+        plan = TransactionPlan(changes, self.plugins)
+        if len(changes.reconfigure_root) > 0:
+            #the backend loads its plugins while the packages are handled
+            self.backend().register()
+        if len(plan.sources) > 0:
+            self.scripted_changes(plan.sources)
+
+        if plan.update:
+            self._run_transaction(self._apt_client().update_cache())
+
+        if plan.hasPackages():
+            self.commit(plan.install, plan.remove, plan.allow_unauth)
+
+        if len(plan.rootChanges()) > 0:
+            self.scripted_changes(plan.rootChanges())
+
+        if len(plan.user) > 0:
+            for plugin in self.plugins:
+                module = plugin.getInformation("module")
+                if module in plan.user:
+                    plugin.user_scripted_changes(plan.user[module])
+
+    def _apt_client(self):
+        """Returns the aptdaemon client, importing it on first use"""
+        if not self.ac:
+            from aptdaemon import client
+            self.ac = client.AptClient()
+        return self.ac
+
+    def commit(self,install,remove,allow_unauth=False):
+        """Installs and removes packages in a single aptdaemon transaction"""
+        # parameter order: install, reinstall, remove, purge, upgrade, downgrade
+        t = self._apt_client().commit_packages(install, [], remove, [], [], [], wait=False)
+        if allow_unauth:
+            t.set_allow_unauthenticated(True)
+        self._run_transaction(t)
+
+    def _run_transaction(self,transaction,timeout=TRANSACTION_TIMEOUT):
+        """Runs an aptdaemon transaction and waits for it to finish.  No
+           one is there to answer questions, so debconf uses its defaults,
+           changed config files are kept and a missing medium or a
+           transaction taking longer than timeout seconds cancels it"""
+        from aptdaemon import enums
+        loop = GLib.MainLoop()
+        problems = []
+        def _reply_failed(e):
+            logging.warning("Unable to answer the package transaction: %s" % e)
+        def _cancel_failed(e):
+            _reply_failed(e)
+            loop.quit()
+        def _cancel(problem):
+            problems.append(problem)
+            transaction.cancel(reply_handler=lambda: None, error_handler=_cancel_failed)
+        def _config_file_conflict(transaction, old, new):
+            logging.info(_("Keeping the changed configuration file ") + old)
+            transaction.resolve_config_file_conflict(old, "keep", reply_handler=lambda: None,
+                                                     error_handler=_reply_failed)
+        def _medium_required(transaction, medium, drive):
+            _cancel(_("The installation medium %s is required in %s.") % (medium, drive))
+        def _timed_out():
+            nonlocal timer
+            timer = None
+            _cancel(_("The package transaction took longer than %d seconds.") % timeout)
+            #don't wait for a transaction that is stuck to notice the cancel
+            loop.quit()
+            return False
+        transaction.connect("finished", lambda transaction, exit: loop.quit())
+        transaction.connect("status-details-changed",
+                            lambda transaction, details: logging.info(details))
+        transaction.connect("config-file-conflict", _config_file_conflict)
+        transaction.connect("medium-required", _medium_required)
+        transaction.set_debconf_frontend("noninteractive")
+        timer = GLib.timeout_add_seconds(timeout, _timed_out)
+        transaction.run()
+        loop.run()
+        if timer is not None:
+            GLib.source_remove(timer)
+        if len(problems) > 0:
+            raise ProvisionError('\n'.join(problems))
+        if transaction.exit != enums.EXIT_SUCCESS:
+            raise ProvisionError(enums.get_error_string_from_enum(transaction.error_code) +
+                                 '\n' + str(transaction.error_details))
+
+    def backend(self):
+        """Returns the D-Bus backend client, connecting on first use"""
+        if self._client is None:
+            from MythbuntuControlPanel.backend import BackendClient
+            self._client = BackendClient()
+        return self._client
+
+    def scripted_changes(self,reconfigure_root):
+        """Runs the root changes as a job of the D-Bus backend"""
+        import dbus
+        loop = GLib.MainLoop()
+        outcome = {}
+        def _finished(job_id, status):
+            outcome['status'] = status
+            loop.quit()
+        def _error(e):
+            outcome['error'] = e
+            loop.quit()
+        self.backend().start_job(reconfigure_root, self.plugin_root_path,
+                               progress=self.report_progress, result=self.report_result,
+                               finished=_finished, error=_error)
+        if len(outcome) == 0:
+            loop.run()
+        if 'error' in outcome:
+            e = outcome['error']
+            if isinstance(e, dbus.DBusException):
+                raise ProvisionError(_("Unable to process changes that require root: ") +
+                                     e.get_dbus_name() + '\n' + str(e.get_dbus_message()))
+            raise ProvisionError(_("The backend has unexpectedly gone away."))
+        if outcome['status'] != 'done':
+            raise ProvisionError(_("Changes that require root were not all applied"))
+
+    def report_progress(self,progress_text,progress):
+        """Logs the progress of the scripted changes"""
+        if progress != 'done' and progress_text is not None:
+            logging.info("%s (%s%%)" % (progress_text, progress))
+        return True
+
+    def report_result(self,plugin,item,success,message):
+        """Logs the root changes that failed to apply"""
+        if not success:
+            self.report_error(_("Unable to apply changes of ") + plugin + ' (' + item + ')', message)
+        return True
+
+    def report_error(self,message,secondary=None):
+        logging.error(message)
+        if secondary is not None:
+            logging.error(secondary)
+        return True
+
+def provision(plugin_root_path,profile_file,dry_run=False):
+    """Applies a provisioning profile, returns an exit status"""
+    import dbus.mainloop.glib
+    dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
+    try:
+        provisioner = Provisioner(plugin_root_path, profile_file)
+        provisioner.load_plugins()
+        (changes, summary) = provisioner.plan()
+        if changes.isEmpty():
+            print(_("No changes found."))
+            return 0
+        print(summary)
+        if dry_run:
+            return 0
+        provisioner.apply(changes)
+    except ProvisionError as e:
+        logging.error(str(e))
+        return 1
+    except:
+        traceback.print_exc()
+        return 2
+    return 0
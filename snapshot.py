@@ -0,0 +1,93 @@
+## -*- coding: utf-8 -*-
+#
+# «snapshot» - Memoized system probes shared by all MCP plugins
+#
+# Copyright (C) 2020, Ted (MythTV forums member heyted)
+#
+# MCP is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 3 of the License, or at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this application; if not, write to the Free Software Foundation, Inc., 51
+# Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##################################################################################
+
+import logging
+import os
+import grp
+import shutil
+import subprocess
+import threading
+
+class SystemSnapshot():
+    """A view of the system that is built once per refresh.  Every fact is
+       probed the first time a plugin asks for it and remembered after
+       that, so plugins asking the same question share a single probe.
+       Safe to use from the worker threads of a parallel refresh."""
+
+    def __init__(self):
+        self._facts = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _memoize(self,key,probe):
+        """Returns the remembered answer for key, running probe once
+           to find it if needed"""
+        with self._lock:
+            if key in self._facts:
+                return self._facts[key]
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        #only one thread probes a given fact, the others wait for it
+        with key_lock:
+            with self._lock:
+                if key in self._facts:
+                    return self._facts[key]
+            logging.debug("Probing system for: %s" % str(key))
+            result = probe()
+            with self._lock:
+                self._facts[key] = result
+        return result
+
+    def group_members(self,group):
+        """Returns the members of a group, or an empty list if the
+           group doesn't exist"""
+        def probe():
+            try:
+                return list(grp.getgrnam(group).gr_mem)
+            except KeyError:
+                return []
+        return self._memoize(('group', group), probe)
+
+    def user_in_group(self,group,user):
+        """Determines if a user is a listed member of group"""
+        return user in self.group_members(group)
+
+    def which(self,executable):
+        """Returns the path of an executable found in PATH, or None"""
+        return self._memoize(('which', executable), lambda: shutil.which(executable))
+
+    def exists(self,path):
+        """Determines if a path exists"""
+        return self._memoize(('exists', path), lambda: os.path.exists(path))
+
+    def isfile(self,path):
+        """Determines if a path is a regular file"""
+        return self._memoize(('isfile', path), lambda: os.path.isfile(path))
+
+    def listdir(self,path):
+        """Returns the entries of a directory.  Errors are raised the same
+           way os.listdir raises them and are not remembered"""
+        return list(self._memoize(('listdir', path), lambda: tuple(os.listdir(path))))
+
+    def unit_active(self,unit):
+        """Determines if a systemd unit is active"""
+        def probe():
+            return subprocess.run(['systemctl', 'is-active', '--quiet', unit]).returncode == 0
+        return self._memoize(('unit', unit), probe)
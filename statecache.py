@@ -0,0 +1,75 @@
+## -*- coding: utf-8 -*-
+#
+# «statecache» - Widget state of each plugin remembered between runs
+#
+# Copyright (C) 2020, Ted (MythTV forums member heyted)
+#
+# MCP is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 3 of the License, or at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this application; if not, write to the Free Software Foundation, Inc., 51
+# Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##################################################################################
+
+import logging
+import os
+import json
+
+class WidgetStateCache():
+    """The widget values of each plugin as of its last captured state,
+       kept in a small per user file.  They are shown at startup while
+       the system is probed again, so they may be out of date and must
+       never be used to compute changes."""
+
+    #bumped whenever the layout of the file changes
+    VERSION = 2
+
+    def __init__(self,cache_file=None):
+        if cache_file is None:
+            cache_file = os.path.join(os.path.expanduser('~'), '.mythbuntu', 'state.json')
+        self._cache_file = cache_file
+        self._plugins = {}
+        self._changed = False
+
+    def load(self):
+        """Reads the cache file, a missing or unreadable one is empty"""
+        try:
+            with open(self._cache_file) as cache:
+                data = json.load(cache)
+        except (OSError, ValueError):
+            return
+        if data.get('version') != self.VERSION:
+            return
+        self._plugins = data.get('plugins', {})
+
+    def save(self):
+        """Writes the cache file if anything changed since it was read"""
+        if not self._changed:
+            return
+        try:
+            os.makedirs(os.path.dirname(self._cache_file), exist_ok=True)
+            temporary = self._cache_file + '.tmp'
+            with open(temporary, 'w') as cache:
+                json.dump({'version': self.VERSION, 'plugins': self._plugins}, cache)
+            os.replace(temporary, self._cache_file)
+            self._changed = False
+        except OSError as e:
+            logging.debug("Unable to write widget state cache: %s" % e)
+
+    def get(self,plugin_name):
+        """Returns the remembered widget state of a plugin, or None"""
+        return self._plugins.get(plugin_name)
+
+    def put(self,plugin_name,state):
+        """Remembers the widget state of a plugin"""
+        if self._plugins.get(plugin_name) != state:
+            self._plugins[plugin_name] = state
+            self._changed = True
@@ -0,0 +1,90 @@
+## -*- coding: utf-8 -*-
+#
+# «timing» - Startup and refresh profiling for MCP
+#
+# Copyright (C) 2020, Ted (MythTV forums member heyted)
+#
+# MCP is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 3 of the License, or at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this application; if not, write to the Free Software Foundation, Inc., 51
+# Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##################################################################################
+
+import logging
+import time
+import io
+import contextlib
+
+class PhaseTimer():
+    """Records the wall time of named phases, such as plugin imports or
+       a plugin's captureState.  A disabled timer records nothing, so
+       callers can time phases unconditionally."""
+
+    def __init__(self,enabled=True,profiler=None,dump_file=None):
+        """profiler is an optional cProfile.Profile that has already been
+           enabled.  It is stopped and reported on by finish, and its raw
+           statistics are written to dump_file if one is given"""
+        self.enabled = enabled
+        self.profiler = profiler
+        self.dump_file = dump_file
+        self.started = time.monotonic()
+        self.finished = False
+        #(name, seconds)
+        self.phases = []
+
+    @contextlib.contextmanager
+    def phase(self,name):
+        """Context manager that times the enclosed block as phase name"""
+        if not self.enabled:
+            yield
+            return
+        begin = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.monotonic() - begin))
+
+    def mark(self,name):
+        """Records the time from the creation of the timer until now"""
+        if self.enabled:
+            self.phases.append((name, time.monotonic() - self.started))
+
+    def report(self):
+        """Returns the recorded phases, slowest first"""
+        lines = []
+        for (name, seconds) in sorted(self.phases, key=lambda phase: phase[1], reverse=True):
+            lines.append("%9.1f ms  %s" % (seconds * 1000, name))
+        return '\n'.join(lines)
+
+    def log_report(self,title):
+        """Logs the report and starts over with no recorded phases"""
+        if not self.enabled:
+            return
+        logging.info("%s:\n%s" % (title, self.report()))
+        self.phases = []
+
+    def finish(self):
+        """Logs the startup report and any profiler statistics.  Only the
+           first call does anything"""
+        if not self.enabled or self.finished:
+            return
+        self.finished = True
+        self.log_report("Startup profile")
+        if self.profiler is not None:
+            import pstats
+            self.profiler.disable()
+            if self.dump_file:
+                self.profiler.dump_stats(self.dump_file)
+                logging.info("Raw profile written to %s" % self.dump_file)
+            stream = io.StringIO()
+            pstats.Stats(self.profiler, stream=stream).sort_stats('cumulative').print_stats(40)
+            logging.info("cProfile statistics:\n%s" % stream.getvalue())
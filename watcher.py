@@ -0,0 +1,128 @@
+## -*- coding: utf-8 -*-
+#
+# «watcher» - Notices changes made outside MCP to the files plugins depend on
+#
+# Copyright (C) 2020, Ted (MythTV forums member heyted)
+#
+# MCP is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 3 of the License, or at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this application; if not, write to the Free Software Foundation, Inc., 51
+# Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##################################################################################
+
+import logging
+import os
+import fnmatch
+
+from gi.repository import Gio, GLib
+
+#Quiet time after the last change before the owner is told about it
+DEBOUNCE_MS = 500
+
+def split_pattern(pattern):
+    """Returns a tuple (directory, name filter) to watch for a path or glob
+       pattern.  name filter is None if everything in directory matters"""
+    path = os.path.expandvars(os.path.expanduser(pattern))
+    (directory, name) = os.path.split(path.rstrip('/'))
+    if any(char in name for char in '*?['):
+        return (directory, name)
+    if os.path.isdir(path):
+        return (path, None)
+    return (directory, name)
+
+class PathWatcher():
+    """Watches the paths each owner, usually a plugin, depends on with Gio
+       file monitors, which use inotify on Linux.  callback is called with
+       the owner from the main loop once its paths have been quiet for
+       DEBOUNCE_MS, so a burst of changes only calls it once.
+
+       Directories are watched rather than files, so files that get
+       created, replaced or deleted are noticed too.  A directory that
+       doesn't exist yet is noticed through its parent."""
+
+    def __init__(self,callback,delay=DEBOUNCE_MS):
+        self.callback = callback
+        self.delay = delay
+        #owner -> list of patterns
+        self._patterns = {}
+        #directory -> [Gio.FileMonitor, [(owner, name filter)]]
+        self._monitors = {}
+        self._pending = set()
+        self._timeout = None
+
+    def watch(self,owner,patterns):
+        """Starts watching patterns, a list of paths or glob patterns that
+           may start with ~ or contain environment variables"""
+        self.unwatch(owner)
+        if len(patterns) == 0:
+            return
+        self._patterns[owner] = list(patterns)
+        for pattern in patterns:
+            (directory, name) = split_pattern(pattern)
+            #wait for a missing directory to show up in its parent
+            while not os.path.isdir(directory) and directory not in ('', '/'):
+                (directory, name) = os.path.split(directory)
+            self._add(directory, owner, name)
+
+    def unwatch(self,owner):
+        """Stops watching everything owner asked for"""
+        self._patterns.pop(owner, None)
+        self._pending.discard(owner)
+        for directory in list(self._monitors):
+            (monitor, watchers) = self._monitors[directory]
+            watchers[:] = [watcher for watcher in watchers if watcher[0] is not owner]
+            if len(watchers) == 0:
+                monitor.cancel()
+                del self._monitors[directory]
+
+    def _add(self,directory,owner,name):
+        if directory not in self._monitors:
+            try:
+                monitor = Gio.File.new_for_path(directory).monitor_directory(
+                              Gio.FileMonitorFlags.NONE, None)
+            except GLib.Error as e:
+                logging.debug("Unable to watch %s: %s" % (directory, e.message))
+                return
+            monitor.connect("changed", self._on_changed, directory)
+            self._monitors[directory] = [monitor, []]
+        self._monitors[directory][1].append((owner, name))
+
+    def _on_changed(self,monitor,changed_file,other_file,event_type,directory):
+        """Gio.FileMonitor handler that queues the interested owners"""
+        if directory not in self._monitors:
+            return
+        names = [changed_file.get_basename()]
+        if other_file is not None:
+            names.append(other_file.get_basename())
+        for (owner, name) in self._monitors[directory][1]:
+            if name is None or any(fnmatch.fnmatch(changed, name) for changed in names):
+                self._pending.add(owner)
+        if len(self._pending) == 0:
+            return
+        #start the quiet period over
+        if self._timeout is not None:
+            GLib.source_remove(self._timeout)
+        self._timeout = GLib.timeout_add(self.delay, self._flush)
+
+    def _flush(self):
+        """Tells each owner with changed paths, once"""
+        self._timeout = None
+        pending = self._pending
+        self._pending = set()
+        for owner in pending:
+            if owner not in self._patterns:
+                continue
+            #directories may have come or gone
+            self.watch(owner, self._patterns[owner])
+            logging.debug("Watched paths changed for: %s" % owner)
+            self.callback(owner)
+        return False